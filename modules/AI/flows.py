@@ -1,40 +1,357 @@
+import asyncio
+import codecs
+import contextlib
+import functools
+import itertools
 import logging
+import queue
 import shutil
+import threading
+import time
+import uuid
+import httpx
+import lxml.etree
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
 
 import os
 import re
-import logging
-from urllib.parse import urljoin, urlparse
-
-from bs4 import BeautifulSoup
+from pathlib import Path
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from urllib.parse import parse_qsl, urlencode, urljoin, urlparse
+from urllib3.util.retry import Retry
+
+from bs4 import BeautifulSoup, SoupStrainer
+from modules.AI.page_cache import CachedPage, PageCache
 from modules.utils.sanitization import sanitize_string
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
+from selenium.common.exceptions import InvalidSessionIdException, NoSuchWindowException
 import json
 
+# orjson parses Gemini's JSON replies roughly twice as fast; its
+# JSONDecodeError subclasses json's, so the except clauses below cover both
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+# Output of spiders/news_spider.py
+WEBSITE_NEWS_PATH = Path("files/latest_news.json")
+
+USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+# Pages whose static HTML yields less visible text than this are assumed to be
+# rendered client-side and are loaded in the headless browser instead
+MIN_STATIC_TEXT_LENGTH = 200
+# Plain HTTP fetches in flight at once when prefetching a flow's links
+PREFETCH_CONCURRENCY = 8
+PREFETCH_TIMEOUT = 30
+# Browsers loading links in parallel in ScraperPool
+SCRAPER_POOL_SIZE = 4
+# Images of one page downloaded at once; kept low so sites don't throttle us
+IMAGE_DOWNLOAD_WORKERS = 8
+# Read/write granularity for image downloads; 1 KB chunks meant a write() per KB
+IMAGE_CHUNK_SIZE = 64 * 1024
+# Larger images (hero banners, animated GIFs) are skipped rather than
+# stalling a page's downloads; the body is streamed so the cap also holds
+# when the server does not send Content-Length
+MAX_IMAGE_BYTES = 5 * 1024 * 1024
+# <img> declared smaller than this (in either dimension) are icons or tracking pixels
+MIN_IMAGE_SIDE = 32
+
+# Image folders of earlier runs of a flow are removed once this old
+IMAGE_RUN_TTL = 24 * 60 * 60
+# Image run -> image URL -> future of the file it was saved to (None if the
+# download failed), kept only while the run downloads images (see
+# `_shared_image_downloads`). Logos and tracking pixels recur on many of a
+# newsletter's pages; later pages copy the file instead of fetching it again.
+# The URL is reserved before its download starts, so concurrent pages wait
+# for that one download instead of fetching (and writing) the image twice
+_DOWNLOADED_IMAGES: Dict[str, Dict[str, "Future[Optional[str]]"]] = {}
+_DOWNLOADED_IMAGES_LOCK = threading.Lock()
+
+# One session for all plain HTTP requests, so connections (and TLS
+# handshakes) to the same host are reused across images and pages
+_HTTP_SESSION = requests.Session()
+# Every browser in the pool downloads a page's images in parallel, so keep
+# enough connections per host for all of them; transient failures get two
+# quick retries
+_HTTP_ADAPTER = HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=SCRAPER_POOL_SIZE * IMAGE_DOWNLOAD_WORKERS,
+    max_retries=Retry(total=2, backoff_factor=0.3),
+)
+_HTTP_SESSION.mount("http://", _HTTP_ADAPTER)
+_HTTP_SESSION.mount("https://", _HTTP_ADAPTER)
+# Static HTML of earlier runs, revalidated with conditional GETs
+_PAGE_CACHE = PageCache()
+# Links every newsletter carries that never lead to an article; matched
+# against whole path segments (extension aside) and query keys/values only,
+# so an article slug that merely contains one of these words is kept
+NON_ARTICLE_LINK = re.compile(
+    r"(?:unsubscribe|opt-?out|manage[-_]?preferences|email[-_]?preferences|update[-_]?profile)(?:\.\w+)?",
+    re.IGNORECASE,
+)
+# charset declared in the page itself (<meta charset> or http-equiv Content-Type)
+_META_CHARSET_RE = re.compile(rb'<meta[^>]+charset\s*=', re.IGNORECASE)
+# charset parameter of a Content-Type header
+_CHARSET_PARAM_RE = re.compile(r'charset\s*=\s*["\']?([\w.:-]+)', re.IGNORECASE)
+# Runs of blank lines in extracted text, collapsed to a single one
+_BLANK_LINES_RE = re.compile(r'\n\s*\n+')
+# Link schemes that would trigger a system action if followed
+_BAD_SCHEME_RE = re.compile(r'^(?:mailto|tel|sms|callto|skype|javascript):', re.IGNORECASE)
+# ALWAYS_CRAWL=1 scrapes every link, as before the pruning
+ALWAYS_CRAWL = os.environ.get("ALWAYS_CRAWL", "").lower() in ("1", "true", "yes")
+# Elements whose text is never visible
+HIDDEN_TAGS = frozenset(("head", "script", "style", "noscript", "iframe", "svg", "template"))
+# Site chrome repeated on every page: menus and footers only cost Gemini
+# tokens. <header> is kept, articles often put their title in one
+BOILERPLATE_TAGS = frozenset(("nav", "footer"))
+SKIPPED_TAGS = HIDDEN_TAGS | BOILERPLATE_TAGS
+# Only <body> is built when parsing a page for its images: <head> (meta,
+# link, title, styles) never becomes Python objects, while every string in
+# the body is kept, as in stream_visible_text
+_PAGE_STRAINER = SoupStrainer("body")
+
+
+class _VisibleTextCollector:
+    """lxml parser target collecting the visible strings of a page as it is parsed.
+
+    No tree is built: the parser calls `start`/`end`/`data` in document
+    order and only the stripped strings outside `SKIPPED_TAGS` are kept, the
+    same strings `BeautifulSoup.get_text(strip=True)` would return.
+    """
+
+    def __init__(self) -> None:
+        self.strings: List[str] = []
+        self._pending: List[str] = []
+        self._hidden_depth = 0
+
+    def _flush(self) -> None:
+        if self._pending:
+            text = "".join(self._pending).strip()
+            if text and not self._hidden_depth:
+                self.strings.append(text)
+            self._pending = []
+
+    def start(self, tag, attrib) -> None:
+        self._flush()
+        if tag in SKIPPED_TAGS:
+            self._hidden_depth += 1
+
+    def end(self, tag) -> None:
+        self._flush()
+        if tag in SKIPPED_TAGS and self._hidden_depth:
+            self._hidden_depth -= 1
+
+    def data(self, data: str) -> None:
+        self._pending.append(data)
+
+    def close(self) -> str:
+        self._flush()
+        return "\n".join(self.strings)
+
+
+def _header_encoding(content_type: str) -> Optional[str]:
+    """The charset of a Content-Type header, or None if it names none (or an unknown one)."""
+    charset = _CHARSET_PARAM_RE.search(content_type)
+    if charset is None:
+        return None
+    try:
+        codecs.lookup(charset.group(1))
+    except LookupError:
+        return None
+    return charset.group(1)
+
+
+def stream_visible_text(chunks: Iterable[Union[str, bytes]], encoding: Optional[str] = None) -> str:
+    """Visible text of an HTML page fed to the parser chunk by chunk, without building a DOM.
+
+    `encoding` is the charset the server sent in its Content-Type header.
+    Without one, bytes are decoded as the page's own <meta charset> says,
+    or as UTF-8 if the page does not declare a charset either.
+    """
+    chunks = iter(chunks)
+    first = next((chunk for chunk in chunks if chunk), b"")
+    if encoding is None and isinstance(first, bytes) and not _META_CHARSET_RE.search(first):
+        encoding = "utf-8"
+    parser = lxml.etree.HTMLParser(target=_VisibleTextCollector(), encoding=encoding)
+    for chunk in itertools.chain((first,), chunks):
+        if chunk:
+            parser.feed(chunk)
+    try:
+        text = parser.close()
+    except lxml.etree.XMLSyntaxError:
+        # nothing was fed
+        return ""
+    return _BLANK_LINES_RE.sub('\n\n', text)
+
+
+def _page_html(link: str, response, cached: Optional[CachedPage]) -> Optional[str]:
+    """HTML of a (conditional) requests/httpx page response, keeping the page cache current."""
+    if response.status_code == 304 and cached is not None:
+        _PAGE_CACHE.touch(link)
+        return cached.html
+    response.raise_for_status()
+    # PDFs and other documents are left to the browser path, as before
+    if "html" not in response.headers.get("content-type", ""):
+        return None
+    _PAGE_CACHE.put(link, response.text, response.headers)
+    return response.text
+
+
+async def _fetch_pages(links: List[str]) -> Dict[str, str]:
+    limits = httpx.Limits(max_connections=PREFETCH_CONCURRENCY)
+    async with httpx.AsyncClient(
+        headers={"User-Agent": USER_AGENT},
+        timeout=PREFETCH_TIMEOUT,
+        follow_redirects=True,
+        limits=limits,
+    ) as client:
+        async def fetch(link: str) -> Tuple[str, Optional[str]]:
+            try:
+                cached = _PAGE_CACHE.get(link)
+                headers = cached.conditional_headers() if cached else None
+                response = await client.get(link, headers=headers)
+                return link, _page_html(link, response, cached)
+            except Exception as e:
+                logging.info("Prefetch failed for %s: %s", link, e)
+                return link, None
+
+        results = await asyncio.gather(*(fetch(link) for link in links))
+    return {link: html for link, html in results if html is not None}
+
+
+def should_scrape(link: str) -> bool:
+    """Whether `link` can lead to article content worth a (browser) scrape."""
+    if ALWAYS_CRAWL:
+        return True
+    parsed = urlparse(link)
+    if parsed.scheme not in ("http", "https"):
+        return False
+    words = parsed.path.split("/")
+    for key, value in parse_qsl(parsed.query, keep_blank_values=True):
+        words += (key, value)
+    return not any(NON_ARTICLE_LINK.fullmatch(word) for word in words)
+
+
+def canonical_link(link: str) -> str:
+    """`link` without its fragment and utm_* tracking parameters.
+
+    Newsletters tag the same article differently in each issue; scraping
+    the canonical form lets all those links share one scrape.
+    """
+    parsed = urlparse(link)
+    query = parsed.query
+    if "utm_" in query.lower():
+        # only re-encoded when there is something to drop, so signed query strings stay intact
+        query = urlencode([(key, value) for key, value in parse_qsl(query, keep_blank_values=True)
+                           if not key.lower().startswith("utm_")])
+    return parsed._replace(query=query, fragment="").geturl()
+
+
+def fetch_pages(links: List[str]) -> Dict[str, str]:
+    """Fetch the static HTML of all `links` concurrently; failed links are left out.
+
+    Most newsletter links are plain server-rendered pages, so fetching them
+    in parallel over HTTP spares a sequential browser page load for each.
+    """
+    links = list(dict.fromkeys(links))
+    if not links:
+        return {}
+    return asyncio.run(_fetch_pages(links))
+
+
+def fetch_page(link: str) -> Optional[str]:
+    """Static HTML of one `link` over the shared session, or None if it is not an HTML page."""
+    try:
+        cached = _PAGE_CACHE.get(link)
+        headers = {"User-Agent": USER_AGENT, **(cached.conditional_headers() if cached else {})}
+        response = _HTTP_SESSION.get(link, headers=headers, timeout=PREFETCH_TIMEOUT)
+        return _page_html(link, response, cached)
+    except Exception as e:
+        logging.info("Static fetch failed for %s: %s", link, e)
+        return None
+
+
+def _wanted_image_source(img) -> Optional[str]:
+    """`src` of an <img> worth downloading: not inline data, not a tracking pixel or icon."""
+    src = img.get("src")
+    if not src or src.startswith("data:"):
+        return None
+    for side in ("width", "height"):
+        value = img.get(side, "")
+        if value.isdigit() and int(value) < MIN_IMAGE_SIDE:
+            return None
+    return src
+
+
+def _collect(chunks: Iterable[bytes], sink: List[bytes]) -> Iterable[bytes]:
+    """Pass `chunks` through, keeping a copy of each in `sink`."""
+    for chunk in chunks:
+        sink.append(chunk)
+        yield chunk
+
+
+CHROME_ARGUMENTS = (
+    "--headless=new",
+    "--no-sandbox",
+    "--disable-dev-shm-usage",
+    "--disable-gpu",
+    "--disable-web-security",
+    "--allow-running-insecure-content",
+    "--disable-extensions",
+    "--disable-background-timer-throttling",
+    "--disable-backgrounding-occluded-windows",
+    "--disable-renderer-backgrounding",
+    "--window-size=1920,1080",
+)
+
+# The browser never renders images: the scraper only needs their URLs, and
+# downloads them itself when asked to
+CHROME_PREFS = {
+    "profile.managed_default_content_settings.images": 2,
+    "profile.default_content_setting_values.notifications": 2,
+}
+
+
+@functools.lru_cache(maxsize=1)
+def _chrome_options() -> Options:
+    """Chrome options built once and shared by every Scraper (they are only read)."""
+    options = Options()
+    for argument in CHROME_ARGUMENTS:
+        options.add_argument(argument)
+    options.add_experimental_option("prefs", CHROME_PREFS)
+    # page_source is read once the DOM is ready; don't wait for images and other subresources
+    options.page_load_strategy = "eager"
+    return options
+
+
+# Errors meaning the browser itself is gone, as opposed to a page failing to load
+BROWSER_LOST_ERRORS = (InvalidSessionIdException, NoSuchWindowException)
+
 
 """MOVE THIS"""
 class Scraper:
     def __init__(self):
-        self.options = Options()
-        self.options.add_argument("--headless=new")
-        self.options.add_argument("--no-sandbox")
-        self.options.add_argument("--disable-dev-shm-usage")
-        self.options.add_argument("--disable-gpu")
-        self.options.add_argument("--disable-web-security")
-        self.options.add_argument("--allow-running-insecure-content")
-        self.options.add_argument("--disable-extensions")
-        self.options.add_argument("--disable-background-timer-throttling")
-        self.options.add_argument("--disable-backgrounding-occluded-windows")
-        self.options.add_argument("--disable-renderer-backgrounding")
-        self.options.add_argument("--remote-debugging-port=9222")
-        self.options.add_argument("--window-size=1920,1080")
+        self.options = _chrome_options()
         self.driver = None
 
     def init_driver(self, url="https://example.com"):
+        if self.driver is not None:
+            # Reuse the running browser; only start a new one if its session is gone.
+            # Page errors (timeouts, DNS...) propagate and keep the browser
+            try:
+                self._clear_cookies()
+                self.driver.get(url)
+                return self.driver
+            except BROWSER_LOST_ERRORS as e:
+                logging.warning(f"WebDriver session lost, starting a new browser: {e}")
+                self.close()
+
         if self.driver is None:
             try:
                 # Try to use Chrome/Chromium
@@ -60,176 +377,446 @@ class Scraper:
         self.driver.get(url)
         return self.driver
 
-    def _filter_problematic_links(self, soup: BeautifulSoup) -> BeautifulSoup:
-        """Remove problematic links that could trigger system actions"""
+    def _clear_cookies(self):
+        """Drop the cookies of every site, so pages do not share state through the reused browser."""
+        if hasattr(self.driver, "execute_cdp_cmd"):
+            # delete_all_cookies() only covers the current document's domain
+            self.driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+        else:
+            # Firefox fallback: no CDP, only the current domain's cookies can be cleared
+            self.driver.delete_all_cookies()
+
+    @staticmethod
+    def _clean_soup(html) -> Tuple[BeautifulSoup, List[Optional[str]]]:
+        """Parse a page, drop scripts/styles and links that trigger system actions.
+
+        Returns the cleaned soup and the `src` of every remaining <img>, all
+        gathered in a single walk over the tree.
+        """
+        # lxml's C parser builds the tree several times faster than html.parser
+        soup = BeautifulSoup(html, "lxml", parse_only=_PAGE_STRAINER)
+
+        image_sources = []
         filtered_count = 0
-        # Find all anchor tags
-        for link in soup.find_all("a", href=True):
-            href = link.get("href", "").lower()
-            # Remove links that start with problematic protocols
-            if href.startswith(('mailto:', 'tel:', 'sms:', 'callto:', 'skype:', 'javascript:')):
-                # Convert to span to preserve text but remove link functionality
-                span = soup.new_tag("span")
-                span.string = link.get_text()
-                link.replace_with(span)
-                filtered_count += 1
-                logging.debug(f"Filtered problematic link: {href}")
-        
+        for tag in soup.find_all(True):
+            # inside a subtree removed earlier in this walk
+            if tag.decomposed:
+                continue
+            if tag.name in SKIPPED_TAGS:
+                tag.decompose()
+            elif tag.name == "a":
+                href = tag.get("href")
+                # Remove links that start with problematic protocols
+                if href is not None and _BAD_SCHEME_RE.match(href):
+                    # Convert to span to preserve text but remove link functionality
+                    span = soup.new_tag("span")
+                    span.string = tag.get_text()
+                    tag.replace_with(span)
+                    tag.decompose()
+                    filtered_count += 1
+                    logging.debug(f"Filtered problematic link: {href}")
+            elif tag.name == "img":
+                image_sources.append(_wanted_image_source(tag))
+
         if filtered_count > 0:
             logging.info(f"Filtered {filtered_count} problematic links from scraped content")
-        
-        return soup
 
-    def scrape_website(self, url: str, download_images=True, folder_extra_name: str = "") -> str:
-        driver = None
-        try:
-            driver = self.init_driver(url)
-            html = driver.page_source
-            
-            soup = BeautifulSoup(html, "html.parser")
+        return soup, image_sources
 
-            # Remove scripts/styles, then filter links
-            for tag in soup(["script", "style", "noscript", "iframe"]):
-                tag.extract()
-            soup = self._filter_problematic_links(soup)
+    @staticmethod
+    def _visible_text(soup: BeautifulSoup) -> str:
+        # Extract *only* visible text, normalize whitespace:
+        text = soup.get_text(separator="\n", strip=True)
+        # Collapse multiple blank lines:
+        return _BLANK_LINES_RE.sub('\n\n', text)
+
+    def scrape_website(self, url: str, download_images=True, folder_extra_name: str = "", html: Optional[str] = None,
+                       sources: Optional[Dict[str, Union[str, bytes]]] = None, fetch_static: bool = True) -> str:
+        """Return the visible text of `url`.
+
+        The page is first fetched over plain HTTP, or taken from `html` if it
+        was already fetched (see `fetch_pages`). That HTML is used directly
+        when it carries enough text; otherwise the page is assumed to be
+        rendered client-side and is loaded in the headless browser.
+        `fetch_static=False` skips the HTTP
+        fetch when `html` is missing, e.g. because the prefetch failed.
+
+        `sources`, if given, receives the HTML the text was taken from under
+        `url`, so its images can be downloaded later without loading the
+        page again (see `download_images`).
+        """
+        if html is None and fetch_static:
+            html = fetch_page(url)
 
-            # Download images if desired (this doesn't affect the text extraction)
+        if html is not None:
             if download_images:
-                self._download_images_from_soup(soup, base_url=url, folder_extra_name=folder_extra_name)
+                soup, image_sources = self._clean_soup(html)
+                text = self._visible_text(soup)
+            else:
+                text = stream_visible_text([html])
+            if len(text) >= MIN_STATIC_TEXT_LENGTH:
+                if sources is not None:
+                    sources[url] = html
+                if download_images:
+                    self._download_images(image_sources, base_url=url, folder_extra_name=folder_extra_name)
+                return text
+            logging.info("Static HTML of %s has little text, loading it in the browser", url)
 
-            # Extract *only* visible text, normalize whitespace:
-            text = soup.get_text(separator="\n", strip=True)
-            # Collapse multiple blank lines:
-            cleaned = re.sub(r'\n\s*\n+', '\n\n', text)
-            return cleaned
+        try:
+            driver = self.init_driver(url)
+            page_source = driver.page_source
+            if sources is not None:
+                sources[url] = page_source
+            if not download_images:
+                return stream_visible_text([page_source])
+
+            soup, image_sources = self._clean_soup(page_source)
+            self._download_images(image_sources, base_url=url, folder_extra_name=folder_extra_name)
+            return self._visible_text(soup)
             
         except Exception as e:
             logging.error(f"WebDriver failed for {url}: {e}")
+            if isinstance(e, BROWSER_LOST_ERRORS):
+                # drop the dead session so the next link starts a fresh browser
+                self.close()
             # Fallback to requests if WebDriver fails
             try:
                 logging.info(f"Attempting fallback requests scraping for {url}")
-                return self._scrape_with_requests(url, download_images, folder_extra_name)
+                return self._scrape_with_requests(url, download_images, folder_extra_name, sources)
             except Exception as fallback_error:
                 logging.error(f"Fallback requests scraping also failed for {url}: {fallback_error}")
                 return None
-        finally:
-            if driver:
-                try:
-                    driver.quit()
-                except Exception as e:
-                    logging.warning(f"Failed to quit driver: {e}")
 
-    def _scrape_with_requests(self, url: str, download_images=True, folder_extra_name: str = "") -> str:
+    def close(self):
+        """Quit the browser, if one was started; the next scrape starts a new one."""
+        if self.driver is not None:
+            try:
+                self.driver.quit()
+            except Exception as e:
+                logging.warning(f"Failed to quit driver: {e}")
+            self.driver = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _scrape_with_requests(self, url: str, download_images=True, folder_extra_name: str = "",
+                              sources: Optional[Dict[str, Union[str, bytes]]] = None) -> str:
         """Fallback scraping method using requests instead of Selenium"""
         headers = {
-            'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+            'User-Agent': USER_AGENT
         }
         
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.content, "html.parser")
-
-        # Remove scripts/styles, then filter links
-        for tag in soup(["script", "style", "noscript", "iframe"]):
-            tag.extract()
-        soup = self._filter_problematic_links(soup)
-
-        # Download images if desired (this doesn't affect the text extraction)
-        if download_images:
-            self._download_images_from_soup(soup, base_url=url, folder_extra_name=folder_extra_name)
-
-        # Extract *only* visible text, normalize whitespace:
-        text = soup.get_text(separator="\n", strip=True)
-        # Collapse multiple blank lines:
-        cleaned = re.sub(r'\n\s*\n+', '\n\n', text)
-        return cleaned
-
-    def _download_images_from_soup(self, soup: BeautifulSoup, base_url: str, folder_extra_name: str = ""):
+        # the context manager releases the connection even if the status check raises
+        with _HTTP_SESSION.get(url, headers=headers, timeout=10, stream=not download_images) as response:
+            response.raise_for_status()
+
+            if not download_images:
+                # parse the body as it arrives instead of buffering it first
+                encoding = _header_encoding(response.headers.get("content-type", ""))
+                if sources is None:
+                    return stream_visible_text(response.iter_content(IMAGE_CHUNK_SIZE), encoding)
+                chunks = []
+                text = stream_visible_text(_collect(response.iter_content(IMAGE_CHUNK_SIZE), chunks), encoding)
+                sources[url] = b"".join(chunks)
+                return text
+
+            content = response.content
+
+        if sources is not None:
+            sources[url] = content
+        soup, image_sources = self._clean_soup(content)
+        self._download_images(image_sources, base_url=url, folder_extra_name=folder_extra_name)
+        return self._visible_text(soup)
+
+    @staticmethod
+    def download_images(url: str, html: Union[str, bytes], folder_extra_name: str = ""):
+        """Download the images of `url` from its already fetched `html`."""
+        _, image_sources = Scraper._clean_soup(html)
+        Scraper._download_images(image_sources, base_url=url, folder_extra_name=folder_extra_name)
+
+    @staticmethod
+    def _download_images(image_sources: List[Optional[str]], base_url: str, folder_extra_name: str = ""):
         folder_name = "images/" + folder_extra_name + "/" + sanitize_string(base_url)
-        os.makedirs(folder_name, exist_ok=True)
 
-        img_tags = soup.find_all("img")
-        logging.info("Found %d images.", len(img_tags))
+        logging.info("Found %d images.", len(image_sources))
 
-        for idx, img in enumerate(img_tags):
-            src = img.get("src")
+        downloads = []
+        for idx, src in enumerate(image_sources):
             if not src:
                 continue
 
             img_url = urljoin(base_url, src)
-            try:
-                response = requests.get(img_url, stream=True, timeout=10)
+            # Choose filename from URL or fallback
+            filename = os.path.basename(urlparse(img_url).path)
+            if not filename or '.' not in filename:
+                filename = f"image_{idx}.jpg"
+            downloads.append((img_url, os.path.join(folder_name, filename)))
+
+        if not downloads:
+            return
+        # an image repeated on the page is fetched (and written) once
+        downloads = list(dict.fromkeys(downloads))
+        # created only for pages that have images, once for all of them
+        os.makedirs(folder_name, exist_ok=True)
+        # images are fetched concurrently over the shared session's pooled connections
+        with ThreadPoolExecutor(max_workers=min(IMAGE_DOWNLOAD_WORKERS, len(downloads))) as executor:
+            list(executor.map(lambda job: Scraper._download_image(*job, run=folder_extra_name), downloads))
+
+    @staticmethod
+    def _download_image(img_url: str, save_path: str, run: str = ""):
+        with _DOWNLOADED_IMAGES_LOCK:
+            downloads = _DOWNLOADED_IMAGES.get(run)
+            # outside `_shared_image_downloads` there is nothing to share the download with
+            pending = downloads.get(img_url) if downloads is not None else None
+            future = None
+            if downloads is not None and pending is None:
+                future = downloads[img_url] = Future()
+
+        if pending is not None:
+            saved_path = pending.result()
+            if saved_path is None:
+                logging.info("Skipped %s: its download already failed in this run", img_url)
+            elif saved_path != save_path:
+                try:
+                    shutil.copyfile(saved_path, save_path)
+                    logging.info("Already downloaded: %s, copied %s → %s", img_url, saved_path, save_path)
+                except OSError as e:
+                    logging.warning("Failed to copy %s: %s", saved_path, str(e))
+            return
+
+        saved_path = None
+        try:
+            if Scraper._fetch_image(img_url, save_path):
+                saved_path = save_path
+        finally:
+            if future is not None:
+                future.set_result(saved_path)
+
+    @staticmethod
+    def _fetch_image(img_url: str, save_path: str) -> bool:
+        """Download `img_url` to `save_path`; False if it failed or was too large."""
+        try:
+            with _HTTP_SESSION.get(img_url, stream=True, timeout=10) as response:
                 response.raise_for_status()
+                content_length = response.headers.get("content-length")
+                # skip oversized images before reading any of the body when the size is announced
+                if int(content_length or 0) > MAX_IMAGE_BYTES:
+                    logging.info("Skipped %s: larger than %d bytes", img_url, MAX_IMAGE_BYTES)
+                    return False
+
+                size = 0
+                with open(save_path, "wb", buffering=IMAGE_CHUNK_SIZE) as f:
+                    if content_length:
+                        # size known to be under the cap: copy in C, without a Python-level loop
+                        response.raw.decode_content = True
+                        shutil.copyfileobj(response.raw, f, IMAGE_CHUNK_SIZE)
+                    else:
+                        for chunk in response.iter_content(IMAGE_CHUNK_SIZE):
+                            size += len(chunk)
+                            if size > MAX_IMAGE_BYTES:
+                                break
+                            f.write(chunk)
+            if size > MAX_IMAGE_BYTES:
+                os.remove(save_path)
+                logging.info("Skipped %s: larger than %d bytes", img_url, MAX_IMAGE_BYTES)
+                return False
+
+            logging.info("Downloaded: %s → %s", img_url, save_path)
+            return True
+        except Exception as e:
+            logging.warning("Failed to download %s: %s", img_url, str(e))
+            return False
 
-                # Choose filename from URL or fallback
-                filename = os.path.basename(urlparse(img_url).path)
-                if not filename or '.' not in filename:
-                    filename = f"image_{idx}.jpg"
 
-                save_path = os.path.join(folder_name, filename)
-                with open(save_path, "wb") as f:
-                    for chunk in response.iter_content(1024):
-                        f.write(chunk)
+def _news_items(response: str, what: str) -> Optional[List[Dict]]:
+    """The "news" array of a Gemini JSON reply, or None if the reply does not parse."""
+    try:
+        return _json_loads(response).get("news", [])
+    except json.JSONDecodeError as e:
+        logging.error(f"Failed to parse Gemini {what} response: {e}")
+        return None
 
-                logging.info("Downloaded: %s → %s", img_url, save_path)
-            except Exception as e:
-                logging.warning("Failed to download %s: %s", img_url, str(e))
+
+class ScraperPool:
+    """A fixed set of Scrapers shared by worker threads to load pages in parallel.
+
+    Page loads are network-bound, so SCRAPER_POOL_SIZE browsers cut the wall
+    time of a batch of links roughly by that factor. Each browser is only
+    started when its Scraper is first used.
+    """
+
+    def __init__(self, size: int = SCRAPER_POOL_SIZE):
+        self.size = size
+        self._scrapers = [Scraper() for _ in range(size)]
+        self._idle: "queue.Queue[Scraper]" = queue.Queue()
+        for scraper in self._scrapers:
+            self._idle.put(scraper)
+
+    def scrape(self, url: str, **kwargs) -> Optional[str]:
+        """`Scraper.scrape_website` on whichever browser is free."""
+        scraper = self._idle.get()
+        try:
+            return scraper.scrape_website(url, **kwargs)
+        finally:
+            self._idle.put(scraper)
+
+    def scrape_many(self, urls: List[str], pages: Optional[Dict[str, str]] = None, **kwargs) -> List[Optional[str]]:
+        """Scrape `urls` concurrently and return the texts in the same order.
+
+        `pages` maps a URL to its prefetched static HTML (see `fetch_pages`).
+        A URL listed more than once is only scraped once.
+        """
+        if not urls:
+            return []
+        # links missing from a prefetch failed it; don't fetch them again
+        prefetched = pages is not None
+        pages = pages or {}
+        unique_urls = list(dict.fromkeys(urls))
+        with ThreadPoolExecutor(max_workers=min(self.size, len(unique_urls))) as executor:
+            texts = dict(zip(unique_urls, executor.map(
+                lambda url: self.scrape(url, html=pages.get(url), fetch_static=not prefetched, **kwargs), unique_urls)))
+        return [texts[url] for url in urls]
+
+    def close(self):
+        for scraper in self._scrapers:
+            scraper.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _new_image_run(flow: str) -> str:
+    """Image folder (under images/) for one run of `flow`, pruning runs older than IMAGE_RUN_TTL.
+
+    Each run gets its own folder, so concurrent runs of a flow (reposts are
+    handled on one thread per mail) no longer delete each other's images.
+    The folder is only created once a page's images are downloaded.
+    """
+    flow_dir = Path("images") / flow
+    cutoff = time.time() - IMAGE_RUN_TTL
+    if flow_dir.is_dir():
+        for run_dir in flow_dir.iterdir():
+            try:
+                if run_dir.stat().st_mtime < cutoff:
+                    shutil.rmtree(run_dir, ignore_errors=True)
+            except FileNotFoundError:
+                # pruned by a concurrent run
+                pass
+    return f"{flow}/{uuid.uuid4().hex}"
+
+
+@contextlib.contextmanager
+def _shared_image_downloads(run: str) -> Iterator[None]:
+    """Within the block, each image URL is downloaded once for all pages of image run `run`."""
+    with _DOWNLOADED_IMAGES_LOCK:
+        _DOWNLOADED_IMAGES[run] = {}
+    try:
+        yield
+    finally:
+        with _DOWNLOADED_IMAGES_LOCK:
+            del _DOWNLOADED_IMAGES[run]
 
 
 """REPOST"""
 def analyze_repost(parsed_mail, intensive_mode=False, include_link_info=False, include_images=False, gemini_handler=None):
-    folder_extra_name = "repost"
-    
-    shutil.rmtree("images/" + folder_extra_name, ignore_errors=True)
-    os.makedirs("images/" + folder_extra_name)
+    folder_extra_name = _new_image_run("repost")
     
     link_articles = {}
-    for link in parsed_mail["links"]:
-        scraper = Scraper()
-        html = scraper.scrape_website(link, download_images=include_images, folder_extra_name=folder_extra_name)
-        if html is not None:
-            link_articles[link] = html
-        else:
-            logging.warning("Failed to scrape website: %s", link)
+    # a link repeated in the mail is scraped, and its text sent, once
+    links = list(dict.fromkeys(link for link in parsed_mail["links"] if should_scrape(link)))
+    pages = fetch_pages(links)
+    # up to SCRAPER_POOL_SIZE browsers load the links in parallel; each starts only when first needed
+    with ScraperPool() as pool, _shared_image_downloads(folder_extra_name):
+        scraped = pool.scrape_many(links, pages, download_images=include_images, folder_extra_name=folder_extra_name)
+        for link, html in zip(links, scraped):
+            if html is not None:
+                link_articles[link] = html
+            else:
+                logging.warning("Failed to scrape website: %s", link)
 
     # concatenate parsed mail Title, text and links to a single string with good formatting
     mail_content = parsed_mail["title"] + "\n\n" + parsed_mail["text"] + "\n\n" + "\n\n".join(link_articles.values())
 
     articles_response = gemini_handler.divide_news_gemini(mail_content)
-    logging.info(f"Received articles response from Gemini: {articles_response}")
+    logging.debug("Received articles response from Gemini: %s", articles_response)
     
     # Parse final response
-    try:
-        articles_data = json.loads(articles_response)
-        final_articles = articles_data.get("news", [])
-        return final_articles
-    except json.JSONDecodeError as e:
-        logging.error(f"Failed to parse Gemini evaluation response: {e}")
-        return []
+    return _news_items(articles_response, "articles") or []
 
 """NEWSLETTER"""
+def _email_label(email_idx: int, email: Dict) -> str:
+    """Title of an e-mail's section in the Gemini prompts."""
+    label = f"EMAIL {email_idx+1}"
+    if "id" in email:
+        label += f" (ID: {email['id']})"
+    if "subject" in email:
+        label += f" - Subject: {email['subject']}"
+    return label
+
+
+def _section_header(title: str) -> str:
+    return f"\n{'='*40}\n{title}\n{'='*40}\n"
+
+
+# Gemini's evaluation of a top-5 article, as passed on to divide_news_gemini
+EVALUATION_TMPL = (
+    "Source: {source}\n"
+    "Brief Description: {brief description}\n"
+    "Reasoning: {reasoning}\n"
+    "Relevancy: {relevancy}\n"
+)
+
+
+class _EvaluationFields(dict):
+    """format_map context: fields Gemini left out render empty (relevancy as 0)."""
+
+    def __missing__(self, key):
+        return 0 if key == "relevancy" else ""
+
+
+def _relevancy(article):
+    return article.get("relevancy", 0)
+
+
 def analyze_emails_newsletter(emails, intensive_mode=False, include_link_info=False, include_website_news=False, include_images=False, gemini_handler=None):
-    folder_extra_name = "newsletter"
-    
-    # clear images folder
-    shutil.rmtree("images/" + folder_extra_name, ignore_errors=True)
-    os.makedirs("images/" + folder_extra_name)
+    folder_extra_name = _new_image_run("newsletter")
 
     # FIRST PASS: scrape all links WITHOUT images and build comprehensive content
-    combined_content = ""
+    # pieces of the evaluation prompt, joined once at the end instead of
+    # re-copying an ever-growing string on every +=
+    content_parts = []
     article_data = {}  # Maps article IDs to complete article information
     article_id_counter = 0
 
-    for email_idx, email in enumerate(emails):
-        email_header = f"\n{'='*40}\nEMAIL {email_idx+1}"
-        if "id" in email:
-            email_header += f" (ID: {email['id']})"
-        if "subject" in email:
-            email_header += f" - Subject: {email['subject']}"
-        email_header += f"\n{'='*40}\n"
-        combined_content += email_header
-        
+    email_links = [[link for link in email.get("links", []) if should_scrape(link)] for email in emails]
+    # links that differ only in tracking parameters are scraped once
+    unique_links = list(dict.fromkeys(canonical_link(link) for links in email_links for link in links))
+
+    # fetch every link's static HTML concurrently up front; the browser is
+    # only used for pages that need client-side rendering
+    pages = fetch_pages(unique_links)
+    # HTML each link's text came from, for the top articles' images
+    page_sources = {}
+
+    # every e-mail's links are scraped in one parallel batch, so a digest
+    # with many short e-mails keeps all the browsers busy; the content is
+    # then assembled in e-mail and link order
+    with ScraperPool() as pool:
+        scraped = dict(zip(unique_links, pool.scrape_many(unique_links, pages, download_images=False,
+                                                          folder_extra_name=folder_extra_name, sources=page_sources)))
+
+    for email_idx, (email, links) in enumerate(zip(emails, email_links)):
+        # shared by all of the e-mail's articles; the per-article header is
+        # only formatted for the top articles in the second pass
+        email_label = _email_label(email_idx, email)
+        content_parts.append(_section_header(email_label))
+
         # Add email content
         email_content = ""
         if "content" in email:
@@ -238,18 +825,16 @@ def analyze_emails_newsletter(emails, intensive_mode=False, include_link_info=Fa
             email_content = f"Body:\n{email['body']}\n"
         elif "text" in email:
             email_content = f"Text:\n{email['text']}\n"
-        combined_content += email_content
+        content_parts.append(email_content)
 
         # Process links without images first
-        links = email.get("links", [])
         for link_idx, link in enumerate(links):
+            html = scraped[canonical_link(link)]
             article_id = f"ARTICLE_{article_id_counter}"
             article_id_counter += 1
-            
-            scraper = Scraper()
-            html = scraper.scrape_website(link, download_images=False, folder_extra_name=folder_extra_name)
+
             link_header = f"\n--- {article_id} - Link {link_idx+1}: {link} ---\n"
-            
+
             # Store complete article information for later use
             article_data[article_id] = {
                 'email_idx': email_idx,
@@ -257,95 +842,123 @@ def analyze_emails_newsletter(emails, intensive_mode=False, include_link_info=Fa
                 'link': link,
                 'email': email,
                 'email_content': email_content,
-                'email_header': f"\n{'='*40}\n{article_id} - EMAIL {email_idx+1}" + 
-                               (f" (ID: {email['id']})" if "id" in email else "") +
-                               (f" - Subject: {email['subject']}" if "subject" in email else "") +
-                               f"\n{'='*40}\n",
+                'email_label': email_label,
                 'scraped_html': html,
                 'link_header': f"\n--- {article_id} - Link: {link} ---\n"
             }
-            
+
             if html is not None:
-                logging.info(f"Scraped content for {link} (first 500 chars): {html[:500]}")
-                combined_content += link_header + html + "\n"
+                logging.debug("Scraped content for %s (first 500 chars): %s", link, html[:500])
+                content_parts.extend((link_header, html, "\n"))
             else:
                 logging.info(f"Failed to scrape content for {link}")
-                combined_content += link_header + "[Failed to scrape this link]\n"
+                content_parts.extend((link_header, "[Failed to scrape this link]\n"))
+
+    if include_website_news:
+        # The news spider already wrote JSON, which Gemini reads as-is: splice
+        # the raw file in as one more article instead of parsing and re-dumping it
+        try:
+            website_news = WEBSITE_NEWS_PATH.read_bytes().decode("utf-8", "replace")
+        except FileNotFoundError:
+            website_news = ""
+            logging.info("No website news found at %s", WEBSITE_NEWS_PATH)
+        if website_news:
+            article_id = f"ARTICLE_{article_id_counter}"
+            article_id_counter += 1
+            link_header = f"\n--- {article_id} - Website news ---\n"
+            article_data[article_id] = {
+                'link': None,
+                'email_content': "",
+                'email_label': "WEBSITE NEWS",
+                'scraped_html': website_news,
+                'link_header': link_header,
+            }
+            content_parts.extend((link_header, website_news, "\n"))
 
     # Send to Gemini for evaluation
-    logging.info(f"Sending to Gemini for evaluation: {combined_content}")
+    combined_content = "".join(content_parts)
+    logging.debug("Sending to Gemini for evaluation: %s", combined_content)
     evaluation_response = gemini_handler.evaluate_articles_gemini(combined_content)
-    logging.info(f"Received evaluation response from Gemini: {evaluation_response}")
+    logging.debug("Received evaluation response from Gemini: %s", evaluation_response)
     
     # Parse JSON response
-    try:
-        evaluation_data = json.loads(evaluation_response)
-        all_articles = evaluation_data.get("news", [])
-    except json.JSONDecodeError as e:
-        logging.error(f"Failed to parse Gemini evaluation response: {e}")
+    all_articles = _news_items(evaluation_response, "evaluation")
+    if all_articles is None:
         return []
 
-    # Sort by relevancy and get top 5
-    all_articles = sorted(all_articles, key=lambda x: x.get("relevancy", 0), reverse=True)
-    top_5_articles = all_articles[:5]
-    logging.info(f"Top 5 articles selected: {[{'ID': a.get('ID', ''), 'relevancy': a.get('relevancy', 0)} for a in top_5_articles]}")
+    # Get the top 5 by relevancy in one sorted pass, skipping articles Gemini
+    # listed more than once under the same ID
+    top_5_articles = []
+    seen_ids = set()
+    for article in sorted(all_articles, key=_relevancy, reverse=True):
+        article_id = article.get("ID")
+        if article_id in seen_ids:
+            continue
+        seen_ids.add(article_id)
+        top_5_articles.append(article)
+        if len(top_5_articles) == 5:
+            break
+    logging.info("Top 5 articles selected: %s", [{'ID': a.get('ID', ''), 'relevancy': _relevancy(a)} for a in top_5_articles])
+    if not top_5_articles:
+        # nothing relevant this week: skip the second Gemini round trip
+        return []
 
-    # SECOND PASS: build content for top 5 articles using stored data and re-scrape only for images
-    top_5_combined_content = ""
+    # SECOND PASS: build content for top 5 articles using stored data, downloading
+    # images from the HTML kept in the first pass instead of loading the pages again
+    top_5_parts = []
+    image_pages = []  # (link, HTML) of the top articles whose images are wanted
     
+    # list the known IDs once, not once per selected article
+    logging.info("Available keys in article_data: %s", list(article_data))
+
     for article in top_5_articles:
         article_id = article.get("ID", "")
         logging.info(f"Looking for article_id '{article_id}' in article_data")
-        logging.info(f"Available keys in article_data: {list(article_data.keys())}")
-        
+
         if article_id in article_data:
             logging.info(f"Found match for article_id '{article_id}'")
             stored_data = article_data[article_id]
-            
+
             # Use stored email header and content
-            top_5_combined_content += stored_data['email_header']
-            top_5_combined_content += stored_data['email_content']
+            top_5_parts.append(_section_header(f"{article_id} - {stored_data['email_label']}"))
+            top_5_parts.append(stored_data['email_content'])
 
             # Add Gemini's evaluation info
-            top_5_combined_content += f"Source: {article.get('source', '')}\n"
-            top_5_combined_content += f"Brief Description: {article.get('brief description', '')}\n"
-            top_5_combined_content += f"Reasoning: {article.get('reasoning', '')}\n"
-            top_5_combined_content += f"Relevancy: {article.get('relevancy', 0)}\n"
-            
-            # Use stored scraped content, but re-scrape for images if needed
-            if include_images:
-                logging.info(f"Re-scraping {stored_data['link']} for images only")
-                scraper = Scraper()
-                # Re-scrape WITH images for this specific link
-                html_with_images = scraper.scrape_website(stored_data['link'], download_images=True, folder_extra_name=folder_extra_name)
-                if html_with_images is not None:
-                    top_5_combined_content += stored_data['link_header'] + html_with_images + "\n"
+            top_5_parts.append(EVALUATION_TMPL.format_map(_EvaluationFields(article)))
+
+            # Use stored scraped content; images come from the stored page HTML
+            link = stored_data['link']
+            if include_images and link:
+                url = canonical_link(link)
+                if url in page_sources:
+                    image_pages.append((url, page_sources[url]))
                 else:
-                    # Fall back to stored HTML if re-scraping fails
-                    logging.warning(f"Failed to re-scrape {stored_data['link']} for images, using stored content")
-                    top_5_combined_content += stored_data['link_header'] + (stored_data['scraped_html'] or "[Failed to scrape this link]") + "\n"
-            else:
-                # Just use the stored HTML content
-                top_5_combined_content += stored_data['link_header'] + (stored_data['scraped_html'] or "[Failed to scrape this link]") + "\n"
+                    logging.warning(f"No page HTML kept for {link}, skipping its images")
+            top_5_parts.extend((stored_data['link_header'], stored_data['scraped_html'] or "[Failed to scrape this link]", "\n"))
         else:
             logging.warning(f"No match found for article_id '{article_id}' in article_data")
 
     # Send comprehensive info about top 5 to divide_news_gemini
-    logging.info(f"Sending to Gemini for news division (first 500 chars): {top_5_combined_content[:500]}")
-    articles_response = gemini_handler.divide_news_gemini(top_5_combined_content)
-    logging.info(f"Received articles response from Gemini: {articles_response}")
+    top_5_combined_content = "".join(top_5_parts)
+    logging.debug("Sending to Gemini for news division (first 500 chars): %s", top_5_combined_content[:500])
+
+    def download_top_images():
+        with _shared_image_downloads(folder_extra_name):
+            for link, html in image_pages:
+                logging.info(f"Downloading images of {link}")
+                Scraper.download_images(link, html, folder_extra_name=folder_extra_name)
+
+    # the prompt only carries text, so the images download while Gemini divides the news
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        images_done = executor.submit(download_top_images)
+        articles_response = gemini_handler.divide_news_gemini(top_5_combined_content)
+        images_done.result()
+    logging.debug("Received articles response from Gemini: %s", articles_response)
     
     # Parse final response
-    try:
-        articles_data = json.loads(articles_response)
-        final_articles = articles_data.get("news", [])
-    except json.JSONDecodeError as e:
-        logging.error(f"Failed to parse Gemini articles response: {e}")
-        return []
-
-    return final_articles
+    return _news_items(articles_response, "articles") or []
 
 if __name__ == "__main__":
-    scraper = Scraper()
-    html = scraper.scrape_website("https://ras.papercept.net/conferences/support/support.php", download_images=True)
+    with Scraper() as scraper:
+        html = scraper.scrape_website("https://ras.papercept.net/conferences/support/support.php", download_images=True)
     print(html)
\ No newline at end of file
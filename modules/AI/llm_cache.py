@@ -0,0 +1,86 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Optional
+
+# LLM_CACHE_MODE values:
+# - enabled:    serve cached responses, call the model and store on a miss
+# - replay:     serve cached responses only, a miss raises LookupError
+# - write_only: always call the model, store every response
+# - disabled:   no caching at all (default)
+CACHE_MODES = ("enabled", "replay", "write_only", "disabled")
+DEFAULT_CACHE_PATH = "files/llm_cache.sqlite"
+
+
+class LLMCache:
+    """SQLite-backed store of model responses keyed by SHA-256 of the request.
+
+    Lets a flow be replayed against the same inputs (e.g. while iterating on
+    the e-mail templates) without paying for another round of inference.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, mode: Optional[str] = None) -> None:
+        self.mode = (mode or os.environ.get("LLM_CACHE_MODE", "disabled")).strip().lower()
+        if self.mode not in CACHE_MODES:
+            raise ValueError(f"Unknown LLM cache mode {self.mode!r}, expected one of {CACHE_MODES}")
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        # the server calls Gemini from several threads
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(*parts: str) -> str:
+        """Hash the request parts (model, settings, prompt...) into a cache key."""
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response BLOB, ts INTEGER)"
+            )
+        return self._conn
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT response FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, key: str, response: bytes) -> None:
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, ts) VALUES (?, ?, ?)",
+                (key, response, int(time.time())),
+            )
+            conn.commit()
+
+    def get_or_compute(self, key: str, compute: Callable[[], Optional[str]]) -> Optional[str]:
+        """Return the cached response for `key`, or call `compute` according to the cache mode."""
+        if self.mode == "disabled":
+            return compute()
+
+        if self.mode in ("enabled", "replay"):
+            cached = self.get(key)
+            if cached is not None:
+                logging.info("LLM cache hit for %s", key[:12])
+                return cached.decode("utf-8")
+            if self.mode == "replay":
+                raise LookupError(f"No cached LLM response for {key} (LLM_CACHE_MODE=replay)")
+
+        response = compute()
+        if response is not None:
+            self.put(key, response.encode("utf-8"))
+        return response
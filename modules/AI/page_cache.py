@@ -0,0 +1,91 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Mapping, NamedTuple, Optional
+
+DEFAULT_PAGE_CACHE_PATH = "files/page_cache.sqlite"
+# Pages not fetched again for this long are dropped from the cache
+PAGE_CACHE_MAX_AGE = 30 * 24 * 60 * 60
+
+
+class CachedPage(NamedTuple):
+    html: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+
+    def conditional_headers(self) -> Dict[str, str]:
+        """Request headers asking the server to answer 304 if the page is unchanged."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class PageCache:
+    """SQLite store of fetched pages and their validators (ETag / Last-Modified).
+
+    Newsletters keep linking the same articles for weeks; revalidating a
+    stored page costs the server a 304 with an empty body instead of the
+    whole page. Only pages that come with a validator are stored.
+    PAGE_CACHE=0 turns the cache off.
+    """
+
+    def __init__(self, path: str = DEFAULT_PAGE_CACHE_PATH, enabled: Optional[bool] = None) -> None:
+        if enabled is None:
+            enabled = os.environ.get("PAGE_CACHE", "1").strip().lower() not in ("0", "false", "no")
+        self.enabled = enabled
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        # pages are fetched from the prefetch loop and the scraper threads
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS pages "
+                "(url TEXT PRIMARY KEY, html TEXT, etag TEXT, last_modified TEXT, ts INTEGER)"
+            )
+            self._conn.execute("DELETE FROM pages WHERE ts < ?", (int(time.time()) - PAGE_CACHE_MAX_AGE,))
+            self._conn.commit()
+        return self._conn
+
+    def get(self, url: str) -> Optional[CachedPage]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT html, etag, last_modified FROM pages WHERE url = ?", (url,)
+            ).fetchone()
+        return CachedPage(*row) if row else None
+
+    def put(self, url: str, html: str, headers: Mapping[str, str]) -> None:
+        """Store `html` with the validators from the response `headers`, if it has any."""
+        if not self.enabled:
+            return
+        etag = headers.get("etag")
+        last_modified = headers.get("last-modified")
+        if not (etag or last_modified):
+            return
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO pages (url, html, etag, last_modified, ts) VALUES (?, ?, ?, ?, ?)",
+                (url, html, etag, last_modified, int(time.time())),
+            )
+            conn.commit()
+
+    def touch(self, url: str) -> None:
+        """Mark a revalidated page as fresh, so it is not aged out."""
+        with self._lock:
+            conn = self._connection()
+            conn.execute("UPDATE pages SET ts = ? WHERE url = ?", (int(time.time()), url))
+            conn.commit()
+        logging.debug("Page unchanged since last fetch: %s", url)
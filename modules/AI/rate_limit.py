@@ -0,0 +1,57 @@
+import threading
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """Requests-per-minute and tokens-per-minute budget for an LLM API.
+
+    Both buckets refill continuously at their per-minute rate and hold at
+    most one minute's worth (`request_burst` requests, if given). `acquire`
+    blocks until a request of the given estimated size fits in both, so
+    calls are spread out up front instead of bursting into 429s and retry
+    back-off. A limit of None disables that bucket.
+    """
+
+    def __init__(self, rpm: Optional[float] = None, tpm: Optional[float] = None,
+                 request_burst: Optional[float] = None) -> None:
+        self.rpm = rpm
+        self.tpm = tpm
+        self.request_capacity = float(request_burst or rpm or 0)
+        self.request_tokens = self.request_capacity
+        self.token_tokens = float(tpm or 0)
+        self.last_update = time.monotonic()
+        # Gemini is called from the newsletter and the check threads
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self.last_update
+        self.last_update = now
+        if self.rpm:
+            self.request_tokens = min(self.request_capacity, self.request_tokens + elapsed * self.rpm / 60)
+        if self.tpm:
+            self.token_tokens = min(self.tpm, self.token_tokens + elapsed * self.tpm / 60)
+
+    def acquire(self, estimated_tokens: int = 0) -> float:
+        """Block until one request of `estimated_tokens` is allowed; return the seconds waited."""
+        if self.tpm:
+            # a prompt larger than the whole bucket only waits for a full one
+            estimated_tokens = min(estimated_tokens, self.tpm)
+        waited = 0.0
+        with self._lock:
+            while True:
+                self._refill(time.monotonic())
+                wait = 0.0
+                if self.rpm and self.request_tokens < 1:
+                    wait = max(wait, (1 - self.request_tokens) * 60 / self.rpm)
+                if self.tpm and self.token_tokens < estimated_tokens:
+                    wait = max(wait, (estimated_tokens - self.token_tokens) * 60 / self.tpm)
+                if wait <= 0:
+                    break
+                time.sleep(wait)
+                waited += wait
+            if self.rpm:
+                self.request_tokens -= 1
+            if self.tpm:
+                self.token_tokens -= estimated_tokens
+        return waited
@@ -1,18 +1,116 @@
+import functools
 import logging
 import os
 import re
 import json
-import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from time import sleep
 from datetime import datetime
-from collections import deque
 from enum import Enum
-from typing import List, Tuple, Optional, Dict
+from typing import List, Tuple, Optional, Dict, Sequence
 
 from google import genai
 from google.genai import types
 from google.genai.errors import ServerError, ClientError
 
+from modules.AI.llm_cache import LLMCache
+from modules.AI.rate_limit import TokenBucket
+
+
+# Files uploaded to / deleted from the Gemini Files API at once
+FILE_TRANSFER_WORKERS = 8
+
+# Server-suggested wait in a 429 error body, e.g. "retryDelay": "30s"
+_RETRY_DELAY_RE = re.compile(r'retryDelay[\'"]?\s*:\s*[\'"](\d+)s[\'"]')
+
+
+# ---------------------------------------------------------------------
+# ▶ SYSTEM INSTRUCTIONS (built once at import) -------------------------
+# ---------------------------------------------------------------------
+
+EVALUATE_SYSTEM_INSTRUCTION = (
+    "You are in charge of creating a newsletter for a university."
+    "You are a helpful assistant that evaluates the quality of the articles and the level of relvancy to the user. "
+    "You are given a list of articles and their related sources content. "
+    "Your task is to evaluate the relevancy of the articles for the user."
+    "IMPORTANT: For each article, use the exact ARTICLE_ID provided in the input text (e.g., ARTICLE_0, ARTICLE_1, etc.) as the ID field in your response."
+    "Only include news that match these themes: Cyber\n‑Physical Systems\n-Digital\n‑Physical Integration\nRobotics\nHuman\n‑Computer Interaction\nArtificial Intelligence\nAutomation\nDecentralized Technologies\nEthics in Technology\nInterdisciplinary Research\nInnovation and Design.\n\n"
+    "‑Today is {today_date} – include only events that have not happened yet.\n"
+    "‑Target audience: undergraduate & graduate students.\n"
+    "‑Score relevancy 0‑100; if similar news appear drastically decrease the scores of the copies.\n"
+)
+
+DIVIDE_SYSTEM_INSTRUCTION = """
+            You are in charge of creating a newsletter for a university.
+            You are given a list of articles and all the related information for each.
+            You write using simple terms but still in a professional way.
+            Your task is to process each article and identify the components:
+            - Title: A simple concise title that you would give to the article.
+            - Source: The source of the article.
+            - Location: The location of the article. 
+            -- Use 'Online' for unspecified locations
+            - Contact: The contact of the article.
+            -- If not provided don't include in response
+            - Description: A medium-detailed description of the article.
+            - Summary: Bite‑sized headline that makes you understand the general idea and vibes of the article.
+            - Category: The category of the article.
+            -- News: General announcements, updates, or developments related to technology, academia, or research that do not involve a specific scheduled event or speaker.
+            --- Examples: New research lab opens, a major award granted, a report released, a partnership announced.
+            -- Talks: One-off academic or expert-led lectures, panels, seminars, or public keynotes.
+            --- Must include a speaker and a scheduled time.
+            --- Examples: Guest lecture on AI Ethics, Seminar by Prof. Smith on robotics.
+            -- Events: Multiday or large-scale organized gatherings such as conferences, symposiums, fairs, or networking meetups.
+            --- Often involve multiple speakers or sessions.
+            --- Examples: ACM Conference on HCI, International Robotics Expo.
+            -- Workshops: Hands-on, skill-focused training sessions or short courses, typically with limited participation.
+            --- Aimed at learning-by-doing.
+            --- Examples: Python for Data Analysis bootcamp, AR prototyping workshop.
+            -- Opportunity: Jobs, internships, fellowships, grants, calls for papers, or student competitions.
+            --- The item offers a chance to apply or participate in something external.
+            --- Examples: Research internship at MIT, Google Summer of Code.
+            -- Other: For articles that don’t clearly fit any of the categories above.
+            --- Use only if none of the others apply.
+            --- Examples: Miscellaneous blog posts, ambiguous updates without context or timing.
+            - Link: most relevant link to the article, the one that once clicked enables the users to read the article.
+            -- Include only a single authoritative link per item.
+            """
+
+
+EVALUATE_SCHEMA = types.Schema(
+    type="OBJECT",
+    required=["news"],
+    properties={
+        "news": types.Schema(
+            type="ARRAY",
+            items=types.Schema(
+                type="OBJECT",
+                required=["source", "brief description", "relevancy"],
+                properties={
+                    "ID": types.Schema(type="STRING"),
+                    "source": types.Schema(type="STRING"),
+                    "brief description": types.Schema(type="STRING"),
+                    "reasoning": types.Schema(type="STRING"),
+                    "relevancy": types.Schema(type="INTEGER"),
+                },
+            ),
+        )
+    },
+)
+
+
+@functools.lru_cache(maxsize=8)
+def _system_parts(system_instruction: str) -> List[types.Part]:
+    """System instruction wrapped as Parts once per distinct text (treat the list as read-only)."""
+    return [types.Part.from_text(text=system_instruction)]
+
+
+@functools.lru_cache(maxsize=1)
+def _news_category_enum() -> Enum:
+    """News categories from configs/mail_configs.json, shared by every handler."""
+    with open("configs/mail_configs.json", "r", encoding="utf-8") as f:
+        category_colors = json.load(f)["category_colors"]
+    return Enum("NewsCategory", {name.upper(): name for name in category_colors.keys()})
+
 
 class GeminiHandler:
     """Unified handler that merges the capabilities of two earlier prototypes.
@@ -20,7 +118,7 @@ class GeminiHandler:
     Key features retained from **version 1**:
     - Category‑aware news parsing (`retrieve_news_gemini`, `divide_news_gemini`).
     - Prompt chunking with a flexible token/length guard (`divide_into_blocks`).
-    - Fine‑grained deque‑based rate‑limiting.
+    - Fine‑grained rate‑limiting (requests and input tokens per minute).
 
     Enhancements adopted from **version 2**:
     - Robust API‑key discovery (env var → .env → credentials file).
@@ -39,6 +137,7 @@ class GeminiHandler:
         model: str = "gemini-2.0-flash-exp",
         rate_limit: int = 30,
         time_window: int = 60,
+        tokens_per_minute: Optional[int] = 1_000_000,
         max_retries: int = 5,
         initial_retry_delay: int = 5,
         max_retry_delay: int = 60,
@@ -52,27 +151,36 @@ class GeminiHandler:
         self.config: Optional[types.GenerateContentConfig] = None
 
         # Category setup ----------------------------------------------------
-        with open("configs/mail_configs.json", "r", encoding="utf‑8") as f:
-            category_colors = json.load(f)["category_colors"]
-        self.NewsCategory = Enum(
-            "NewsCategory", {name.upper(): name for name in category_colors.keys()}
-        )
+        self.NewsCategory = _news_category_enum()
 
         # Rate limiting -----------------------------------------------------
-        self.requests_timestamps: deque[float] = deque(maxlen=rate_limit)
+        # `rate_limit` requests per `time_window` seconds, plus an input-token
+        # budget; prompt size is estimated at ~4 characters per token
         self.rate_limit = rate_limit
         self.time_window = time_window
+        self.token_bucket = TokenBucket(
+            rpm=rate_limit * 60 / time_window, tpm=tokens_per_minute, request_burst=rate_limit
+        )
 
         # Retry parameters --------------------------------------------------
         self.max_retries = max_retries
         self.initial_retry_delay = initial_retry_delay
         self.max_retry_delay = max_retry_delay
 
+        # Response cache (off unless LLM_CACHE_MODE says otherwise) ----------
+        self.cache = LLMCache()
+
+        # News call configs, built once -------------------------------------
+        self._divide_call = self._news_config(self._divide_schema(), DIVIDE_SYSTEM_INSTRUCTION)
+        # the evaluation prompt carries today's date: rebuilt when it changes
+        self._evaluate_call: Optional[Tuple[str, types.GenerateContentConfig, Tuple[str, ...]]] = None
+
     # ------------------------------------------------------------------
     # ▶ PRIVATE HELPERS ------------------------------------------------
     # ------------------------------------------------------------------
 
     @staticmethod
+    @functools.lru_cache(maxsize=1)
     def _discover_api_key() -> str:
         """Locate a Gemini API key via env‑var, .env file or JSON creds."""
         if (key := os.environ.get("GEMINI_API_KEY")):
@@ -80,7 +188,7 @@ class GeminiHandler:
 
         # .env fallback --------------------------------------------------
         try:
-            with open(".env", "r", encoding="utf‑8") as f:
+            with open(".env", "r", encoding="utf-8") as f:
                 for line in f:
                     if line.strip().startswith("GEMINI_API_KEY"):
                         return line.split("=", 1)[1].strip()
@@ -89,38 +197,13 @@ class GeminiHandler:
 
         # credentials/key.json fallback ----------------------------------
         try:
-            with open("credentials/key.json", "r", encoding="utf‑8") as f:
+            with open("credentials/key.json", "r", encoding="utf-8") as f:
                 return json.load(f)["key"]
         except FileNotFoundError:
             raise RuntimeError(
                 "Gemini API key not found – set GEMINI_API_KEY or supply .env/credentials/key.json"
             )
 
-    # ------------------------------------------------------------------
-    # ▶ RATE‑LIMITING ---------------------------------------------------
-    # ------------------------------------------------------------------
-
-    def _check_rate_limit(self) -> None:
-        """Block until a new request is allowed under the moving window."""
-        now = time.time()
-
-        # Drop timestamps older than the window -------------------------
-        while self.requests_timestamps and now - self.requests_timestamps[0] >= self.time_window:
-            self.requests_timestamps.popleft()
-
-        # If window full, wait until head expires ----------------------
-        if len(self.requests_timestamps) >= self.rate_limit:
-            wait_for = self.time_window - (now - self.requests_timestamps[0])
-            if wait_for > 0:
-                print(f"⏳  Rate‑limit hit – sleeping {wait_for:.1f}s …")
-                sleep(wait_for)
-            # Clean up after wait
-            while self.requests_timestamps and time.time() - self.requests_timestamps[0] >= self.time_window:
-                self.requests_timestamps.popleft()
-
-        # Record this request ------------------------------------------
-        self.requests_timestamps.append(time.time())
-
     # ------------------------------------------------------------------
     # ▶ LOW‑LEVEL REQUEST WRAPPER --------------------------------------
     # ------------------------------------------------------------------
@@ -128,8 +211,13 @@ class GeminiHandler:
     def _generate(self, *, contents: List[types.Content], config: types.GenerateContentConfig) -> types.GenerateContentResponse:
         """Unified calling layer: rate‑limit + retries + error handling."""
         delay = self.initial_retry_delay
+        estimated_tokens = sum(
+            len(part.text or "") for content in contents for part in (content.parts or [])
+        ) // 4
         for attempt in range(self.max_retries + 1):
-            self._check_rate_limit()
+            waited = self.token_bucket.acquire(estimated_tokens)
+            if waited:
+                logging.info("Rate limit hit – waited %.1fs for a request of ~%d tokens", waited, estimated_tokens)
             try:
                 return self.client.models.generate_content(
                     model=self.model,
@@ -146,7 +234,7 @@ class GeminiHandler:
 
                 # Back‑off ------------------------------------------------
                 suggested = None
-                if quota and (m := re.search(r"retryDelay\": \"(\d+)s\"", msg)):
+                if quota and (m := _RETRY_DELAY_RE.search(msg)):
                     suggested = int(m.group(1))
                 wait = suggested or delay
                 print(
@@ -168,14 +256,15 @@ class GeminiHandler:
         if len(text) <= max_block_size:
             return [text]
         blocks: List[str] = []
+        text_length = len(text)
         start = 0
-        while start < len(text):
-            end = min(start + max_block_size, len(text))
-            if end < len(text):
-                # Prefer split on last period
-                last_dot = text[start:end].rfind(".")
+        while start < text_length:
+            end = min(start + max_block_size, text_length)
+            if end < text_length:
+                # Prefer split on last period (searched in place, without copying the window)
+                last_dot = text.rfind(".", start, end)
                 if last_dot != -1:
-                    end = start + last_dot + 1
+                    end = last_dot + 1
             blocks.append(text[start:end])
             start = end
         return blocks
@@ -184,18 +273,25 @@ class GeminiHandler:
     # ▶ GENERIC ASK (non‑chat) -----------------------------------------
     # ------------------------------------------------------------------
     def generic_ask_gemini(self, prompt: str, *, temperature: float = 1.0) -> List[str]:
-        """Ask Gemini, chunking long prompts and returning each block's response."""
+        """Ask Gemini, chunking long prompts and returning each block's response.
+
+        Blocks are sent concurrently (within the rate limit), so a long prompt
+        takes about as long as its slowest block rather than the sum of all.
+        """
         blocks = self.divide_into_blocks(prompt)
-        out: List[str] = []
-        for block in blocks:
-            cfg = types.GenerateContentConfig(
-                temperature=temperature,
-                response_mime_type="text/plain",
-            )
+        cfg = types.GenerateContentConfig(
+            temperature=temperature,
+            response_mime_type="text/plain",
+        )
+
+        def ask(block: str) -> str:
             content_obj = [types.Content(role="user", parts=[types.Part.from_text(text=block)])]
-            response = self._generate(contents=content_obj, config=cfg)
-            out.append(response.text)
-        return out
+            return self._generate(contents=content_obj, config=cfg).text
+
+        if len(blocks) == 1:
+            return [ask(blocks[0])]
+        with ThreadPoolExecutor(max_workers=min(len(blocks), self.rate_limit)) as executor:
+            return list(executor.map(ask, blocks))
 
     # ------------------------------------------------------------------
     # ▶ CHAT‑STYLE GENERATE --------------------------------------------
@@ -221,7 +317,7 @@ class GeminiHandler:
 
         cfg = types.GenerateContentConfig(
             response_mime_type="text/plain",
-            system_instruction=[types.Part.from_text(text=system_instruction)] if system_instruction else None,
+            system_instruction=_system_parts(system_instruction) if system_instruction else None,
         )
         response = self._generate(contents=contents, config=cfg)
         history.extend([("user", prompt), ("model", response.text)])
@@ -231,7 +327,11 @@ class GeminiHandler:
     # ▶ NEWS‑SPECIFIC ENDPOINTS ----------------------------------------
     # ------------------------------------------------------------------
 
-    def _news_call(self, prompt: str, *, schema: types.Schema, system_instruction: str) -> str:
+    @staticmethod
+    def _news_config(
+        schema: types.Schema, system_instruction: str
+    ) -> Tuple[types.GenerateContentConfig, Tuple[str, ...]]:
+        """Config of a JSON news call, with its cache-key parts (schema serialised once)."""
         cfg = types.GenerateContentConfig(
             temperature=1.0,
             top_p=0.95,
@@ -239,55 +339,41 @@ class GeminiHandler:
             max_output_tokens=8192,
             response_schema=schema,
             response_mime_type="application/json",
-            system_instruction=system_instruction,
+            system_instruction=_system_parts(system_instruction),
+        )
+        return cfg, (str(cfg.temperature), schema.model_dump_json(exclude_none=True), system_instruction)
+
+    def _news_call(
+        self,
+        prompt: str,
+        cfg: types.GenerateContentConfig,
+        key_parts: Tuple[str, ...],
+        files: Sequence[types.File] = (),
+    ) -> str:
+        parts = [types.Part.from_text(text=prompt)]
+        parts.extend(types.Part.from_uri(file_uri=f.uri, mime_type=f.mime_type) for f in files)
+        content_obj = [types.Content(role="user", parts=parts)]
+        key = LLMCache.make_key(self.model, *key_parts, prompt, *(f.uri for f in files))
+        return self.cache.get_or_compute(
+            key, lambda: self._generate(contents=content_obj, config=cfg).text
         )
-        content_obj = [types.Content(role="user", parts=[types.Part.from_text(text=prompt)])]
-        response = self._generate(contents=content_obj, config=cfg)
-        return response.text
 
     def evaluate_articles_gemini(self, prompt: str) -> str:
         """Filter raw text into future‑relevant tech news items (JSON)."""
-
-        json_schema = types.Schema(
-            type="OBJECT",
-            required=["news"],
-            properties={
-                "news": types.Schema(
-                    type="ARRAY",
-                    items=types.Schema(
-                        type="OBJECT",
-                        required=["source", "brief description", "relevancy"],
-                        properties={
-                            "ID": types.Schema(type="STRING"),
-                            "source": types.Schema(type="STRING"),
-                            "brief description": types.Schema(type="STRING"),
-                            "reasoning": types.Schema(type="STRING"),
-                            "relevancy": types.Schema(type="INTEGER"),
-                        },
-                    ),
-                )
-            },
-        ) 
-
-        today_date = datetime.now().strftime("%Y/%m/%d") 
-        
-        system_instruction = (
-            "You are in charge of creating a newsletter for a university."
-            "You are a helpful assistant that evaluates the quality of the articles and the level of relvancy to the user. "
-            "You are given a list of articles and their related sources content. "
-            "Your task is to evaluate the relevancy of the articles for the user."
-            "IMPORTANT: For each article, use the exact ARTICLE_ID provided in the input text (e.g., ARTICLE_0, ARTICLE_1, etc.) as the ID field in your response."
-            "Only include news that match these themes: Cyber\n‑Physical Systems\n-Digital\n‑Physical Integration\nRobotics\nHuman\n‑Computer Interaction\nArtificial Intelligence\nAutomation\nDecentralized Technologies\nEthics in Technology\nInterdisciplinary Research\nInnovation and Design.\n\n"
-            f"‑Today is {today_date} – include only events that have not happened yet.\n"
-            "‑Target audience: undergraduate & graduate students.\n"
-            #"‑ Job opportunities ➜ exclude.\n"
-            "‑Score relevancy 0‑100; if similar news appear drastically decrease the scores of the copies.\n"
-        )
-        return self._news_call(prompt, schema=json_schema, system_instruction=system_instruction)
+        today = datetime.now().strftime("%Y/%m/%d")
+        if self._evaluate_call is None or self._evaluate_call[0] != today:
+            system_instruction = EVALUATE_SYSTEM_INSTRUCTION.format(today_date=today)
+            self._evaluate_call = (today, *self._news_config(EVALUATE_SCHEMA, system_instruction))
+        _, cfg, key_parts = self._evaluate_call
+        return self._news_call(prompt, cfg, key_parts)
 
     def divide_news_gemini(self, prompt: str) -> str:
         """Transform news JSON into categorised/colour‑coded digest."""
-        json_schema = types.Schema(
+        return self._news_call(prompt, *self._divide_call)
+
+    def _divide_schema(self) -> types.Schema:
+        """Schema of the digest; categories come from configs/mail_configs.json."""
+        return types.Schema(
             type="OBJECT",
             required=["news"],
             properties={
@@ -313,43 +399,6 @@ class GeminiHandler:
                 )
             },
         )
-        system_instruction = (
-            """
-            You are in charge of creating a newsletter for a university.
-            You are given a list of articles and all the related information for each.
-            You write using simple terms but still in a professional way.
-            Your task is to process each article and identify the components:
-            - Title: A simple concise title that you would give to the article.
-            - Source: The source of the article.
-            - Location: The location of the article. 
-            -- Use 'Online' for unspecified locations
-            - Contact: The contact of the article.
-            -- If not provided don't include in response
-            - Description: A medium-detailed description of the article.
-            - Summary: Bite‑sized headline that makes you understand the general idea and vibes of the article.
-            - Category: The category of the article.
-            -- News: General announcements, updates, or developments related to technology, academia, or research that do not involve a specific scheduled event or speaker.
-            --- Examples: New research lab opens, a major award granted, a report released, a partnership announced.
-            -- Talks: One-off academic or expert-led lectures, panels, seminars, or public keynotes.
-            --- Must include a speaker and a scheduled time.
-            --- Examples: Guest lecture on AI Ethics, Seminar by Prof. Smith on robotics.
-            -- Events: Multiday or large-scale organized gatherings such as conferences, symposiums, fairs, or networking meetups.
-            --- Often involve multiple speakers or sessions.
-            --- Examples: ACM Conference on HCI, International Robotics Expo.
-            -- Workshops: Hands-on, skill-focused training sessions or short courses, typically with limited participation.
-            --- Aimed at learning-by-doing.
-            --- Examples: Python for Data Analysis bootcamp, AR prototyping workshop.
-            -- Opportunity: Jobs, internships, fellowships, grants, calls for papers, or student competitions.
-            --- The item offers a chance to apply or participate in something external.
-            --- Examples: Research internship at MIT, Google Summer of Code.
-            -- Other: For articles that don’t clearly fit any of the categories above.
-            --- Use only if none of the others apply.
-            --- Examples: Miscellaneous blog posts, ambiguous updates without context or timing.
-            - Link: most relevant link to the article, the one that once clicked enables the users to read the article.
-            -- Include only a single authoritative link per item.
-            """
-        )
-        return self._news_call(prompt, schema=json_schema, system_instruction=system_instruction)
 
     def evaluate_images_gemini(self, prompt: str, images: List[Dict[str, str]],) -> str:
         """
@@ -376,16 +425,7 @@ class GeminiHandler:
         )
 
         logging.info(f"Uploading {len(images)} images with contexts")
-        uploaded_files = []
-        contexts = []
-        for item in images:
-            path = item["image_path"]
-            ctx  = item["article_id"]
-            # upload the image
-            uploaded = self.client.files.upload(file=path, purpose="ARTICLE_IMAGE")
-            uploaded_files.append(uploaded)
-            contexts.append(ctx)
-        logging.info(f"Uploaded {len(uploaded_files)} images")
+        contexts = [item["article_id"] for item in images]
 
         # Enhance the system instruction to remind the model that each image has context
         system_instruction = (
@@ -402,19 +442,35 @@ class GeminiHandler:
             + "\n".join(f"{i+1}. {ctx}" for i, ctx in enumerate(contexts))
         )
 
-        # Call into your wrapper; pass both the file handles and their contexts
-        response = self._news_call(
-            prompt=prompt,
-            schema=json_schema,
-            system_instruction=system_instruction,
-            uploaded_files=uploaded_files,
-            file_contexts=contexts,
-        )
-
-        logging.info(f"Deleting {len(uploaded_files)} images")
-        for f in uploaded_files:
-            self.client.files.delete(file_id=f.id)
-        logging.info("All uploaded images deleted")
+        uploaded: Dict[int, types.File] = {}  # input position -> uploaded file, as each completes
+        try:
+            # uploads are network-bound: send them in parallel; every upload is
+            # waited for, so the ones that succeeded are deleted even if another fails
+            error = None
+            with ThreadPoolExecutor(max_workers=FILE_TRANSFER_WORKERS) as executor:
+                futures = {
+                    executor.submit(self.client.files.upload, file=item["image_path"]): idx
+                    for idx, item in enumerate(images)
+                }
+                for future in as_completed(futures):
+                    try:
+                        uploaded[futures[future]] = future.result()
+                    except Exception as e:
+                        error = error or e
+            if error is not None:
+                raise error
+            logging.info(f"Uploaded {len(uploaded)} images")
+
+            response = self._news_call(
+                prompt,
+                *self._news_config(json_schema, system_instruction),
+                files=[uploaded[idx] for idx in range(len(images))],
+            )
+        finally:
+            logging.info(f"Deleting {len(uploaded)} images")
+            with ThreadPoolExecutor(max_workers=FILE_TRANSFER_WORKERS) as executor:
+                list(executor.map(lambda f: self.client.files.delete(name=f.name), uploaded.values()))
+            logging.info("All uploaded images deleted")
 
         return response
 
@@ -0,0 +1,129 @@
+"""Static HTML fragments shared by the newsletter and repost email generators."""
+from typing import Final
+
+# Document head, styles and outer table scaffolding. Only `{title}` is a format
+# slot; literal CSS braces are doubled.
+HEAD_PREFIX: Final[str] = '''<!DOCTYPE html>
+<html>
+    <head>
+        <meta charset="UTF-8" />
+        <meta name="viewport" content="width=device-width, initial-scale=1.0" />
+        <title>{title}</title>
+        <style type="text/css">
+            .article-desc {{
+                position: relative !important;
+                display: block !important;
+            }}
+            .article-desc .summary {{
+                opacity: 0;
+                visibility: hidden;
+                transition: opacity 0.2s;
+            }}
+            .article-desc:hover .summary {{
+                display: block !important;
+                opacity: 1 !important;
+                visibility: visible !important;
+            }}
+            body {{
+                margin: 0;
+                padding: 0;
+            }}
+            table {{
+                margin: 0;
+                padding: 0;
+            }}
+        </style>
+    </head>
+    <body style="margin: 0; padding: 0; background-color: #f4f4f4; font-family: Arial, sans-serif;">
+        <table width="100%" cellpadding="0" cellspacing="0" style="background-color: #f4f4f4; margin: 0;">
+            <tr>
+                <td align="center" style="padding: 0;">
+                    <table width="600" cellpadding="0" cellspacing="0" style="background-color: #ffffff; margin: 0;">
+'''
+HEAD_SUFFIX: Final[str] = '''
+                    </table>
+                </td>
+            </tr>
+        </table>
+    </body>
+</html>'''
+
+# Article templates are plain strings filled with `format_map`, so the markup is
+# parsed once at import instead of on every article.
+# The optional image/contact fragments have a single slot each and use
+# %-formatting; note the doubled `%%` in the image style.
+IMG_TMPL: Final[str] = '<img src="%s" alt="Article Image" style="width: 100%%; display: block; margin-bottom: 12px; border-radius: 8px;">'
+CONTACT_TMPL: Final[str] = '<div>Contact: %s</div>'
+ARTICLE_TMPL: Final[str] = '''
+        <tr>
+            <td style="padding: 8px 20px;">
+                <div style="background-color: #fafafa; border: 2px solid {border_color}; border-radius: 8px; 
+                           margin-bottom: 8px; padding: 12px;">
+                    {image_block}
+                    <div style="font-size: 20px; color: #333333; font-weight: bold; margin-bottom: 8px;">
+                        {title}
+                    </div>
+                    <div style="font-size: 14px; color: #777777; margin-bottom: 8px; line-height: 1.4;">
+                        <div>Source: {source}</div>
+                        <div>Location: {location}</div>
+                        {contact_block}
+                        <div>Category: {category}</div>
+                    </div>
+                    <div style="display: block; font-size: 16px; color: #555555; line-height: 1.5; 
+                              position: relative; min-height: 50px;" class="article-desc">
+                        <div style="position: relative;">
+                            {description}
+                        </div>
+                        <div style="display: none; position: absolute; background-color: rgba(249, 249, 249, 0.95); 
+                                  color: #333333; border: 1px solid #cccccc; padding: 5px; 
+                                  width: 100%; height: 100%; font-size: 14px; z-index: 20; 
+                                  border-radius: 5px; top: 0; left: 0; box-sizing: border-box;" 
+                             class="summary">
+                             Summary: {summary}
+                        </div>
+                    </div>
+                    <div style="margin-top: 8px;">
+                        <a href="{link}" style="font-size: 16px; color: {border_color}; 
+                           text-decoration: none;">Read more</a>
+                    </div>
+                </div>
+            </td>
+        </tr>'''
+
+SECTION_HEADER_TMPL: Final[str] = '''
+        <tr>
+            <td style="background-color: {header_color}; color: #ffffff; text-align: center; padding: 10px; font-size: 18px;">
+                {category}
+            </td>
+        </tr>'''
+
+FOOTER_TMPL: Final[str] = '''
+        <tr>
+            <td style="text-align: center; background-color: #f4f4f4; color: #777777; 
+                       padding: 12px; font-size: 12px;">
+                {footer_text}
+                <br><br>
+                <div style="margin-top: 8px; padding-top: 8px; border-top: 1px solid #cccccc;">
+                    <em>This email is automatically generated.</em>
+                </div>
+            </td>
+        </tr>
+        <tr>
+            <td style="text-align: center; background-color: #e8f4fd; color: #333333; 
+                       padding: 20px; border: 2px solid #0066cc; border-radius: 8px; margin: 10px;">
+                <div style="font-size: 18px; font-weight: bold; color: #0066cc; margin-bottom: 12px;">
+                    📝 Your Feedback Matters!
+                </div>
+                <div style="font-size: 16px; line-height: 1.4; margin-bottom: 15px;">
+                    Your feedback is really important to improve the project.<br>
+                    Please help us enhance your experience by sharing your thoughts!
+                </div>
+                <a href="https://forms.gle/UegbAWJ6zEcv7yKT8" 
+                   style="display: inline-block; background-color: #0066cc; color: #ffffff; 
+                          padding: 12px 24px; font-size: 16px; font-weight: bold; 
+                          text-decoration: none; border-radius: 5px; 
+                          box-shadow: 0 2px 4px rgba(0,102,204,0.3);">
+                    Complete Feedback Form
+                </a>
+            </td>
+        </tr>'''
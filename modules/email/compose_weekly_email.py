@@ -1,15 +1,65 @@
+import functools
+import io
+from html import escape
 import json
-from collections import defaultdict
-from typing import List, Dict
+from itertools import groupby
+from typing import Iterable, Dict, Optional, TextIO, Tuple
+
+from modules.email._templates import (
+    ARTICLE_TMPL,
+    CONTACT_TMPL,
+    FOOTER_TMPL,
+    HEAD_PREFIX,
+    HEAD_SUFFIX,
+    IMG_TMPL,
+    SECTION_HEADER_TMPL,
+)
+
+
+@functools.lru_cache(maxsize=4096)
+def _render_article(items: Tuple, border_color: str, skip_images: bool, pre_escaped: bool) -> str:
+    """Render one article from its (key, value) pairs; pure, so results are cached."""
+    # Escape every text field exactly once; skipped when the caller already did it
+    if pre_escaped:
+        ctx = dict(items)
+    else:
+        ctx = {key: escape(value) if isinstance(value, str) else value for key, value in items}
+    ctx.setdefault("category", "Other")
+    ctx["border_color"] = border_color
+    image = None if skip_images else ctx.get("image")
+    ctx["image_block"] = IMG_TMPL % image if image else ""
+    contact = ctx.get("contact")
+    ctx["contact_block"] = CONTACT_TMPL % contact if contact else ""
+
+    return ARTICLE_TMPL.format_map(ctx)
+
+
+def _category_of(article: Dict) -> str:
+    return article.get("category", "Other")
+
+
+def _render_article_cached(article: Dict, border_color: str, skip_images: bool, pre_escaped: bool) -> str:
+    """Render `article` through the LRU cache when its values are hashable."""
+    try:
+        return _render_article(tuple(sorted(article.items())), border_color, skip_images, pre_escaped)
+    except TypeError:
+        # Unhashable field values (lists, dicts): render without the cache
+        return _render_article.__wrapped__(tuple(article.items()), border_color, skip_images, pre_escaped)
+
 
 class NewsEmailGenerator:
-    def __init__(self, title: str = "Weekly News", footer_text: str = "Powered by Ie Robotics & AI Lab", skip_images: bool = True):
+    def __init__(self, title: str = "Weekly News", footer_text: str = "Powered by Ie Robotics & AI Lab", skip_images: bool = True,
+                 group_by_category: bool = True, pre_escaped: bool = False):
         self.title = title
+        self._prefix = HEAD_PREFIX.format_map({"title": title})
         self.footer_text = footer_text
-        with open("configs/mail_configs.json", 'r') as file:
+        with open("configs/mail_configs.json", 'r', encoding="utf-8") as file:
             config_data = json.load(file)
             self.category_colors = config_data["category_colors"]
         self.skip_images = skip_images
+        self.group_by_category = group_by_category
+        self.pre_escaped = pre_escaped
+        self._section_headers: Dict[str, str] = {}
 
     def generate_header(self) -> str:
         """Generate the header of the email based on the title variable."""
@@ -21,152 +71,72 @@ class NewsEmailGenerator:
             </td>
         </tr>'''
 
-    def generate_article(self, article: Dict) -> str:
-        """Generate the HTML for a single news article."""
-        category = article.get("category", "Other")
-
-        border_color = self.category_colors.get(category, self.category_colors["Other"])
+    def category_color(self, category: str) -> str:
+        """Return the configured color for `category`, falling back to "Other"."""
+        return self.category_colors.get(category, self.category_colors["Other"])
 
-        return f'''
-        <tr>
-            <td style="padding: 8px 20px;">
-                <div style="background-color: #fafafa; border: 2px solid {border_color}; border-radius: 8px; 
-                           margin-bottom: 8px; padding: 12px;">
-                    {'<img src="' + article["image"] + '" alt="Article Image" style="width: 100%; display: block; margin-bottom: 12px; border-radius: 8px;">' if "image" in article and not self.skip_images else ""}
-                    <div style="font-size: 20px; color: #333333; font-weight: bold; margin-bottom: 8px;">
-                        {article["title"]}
-                    </div>
-                    <div style="font-size: 14px; color: #777777; margin-bottom: 8px; line-height: 1.4;">
-                        <div>Source: {article["source"]}</div>
-                        <div>Location: {article["location"]}</div>
-                        {'<div>Contact: ' + article["contact"] + '</div>' if "contact" in article else ""}
-                        <div>Category: {category}</div>
-                    </div>
-                    <div style="display: block; font-size: 16px; color: #555555; line-height: 1.5; 
-                              position: relative; min-height: 50px;" class="article-desc">
-                        <div style="position: relative;">
-                            {article["description"]}
-                        </div>
-                        <div style="display: none; position: absolute; background-color: rgba(249, 249, 249, 0.95); 
-                                  color: #333333; border: 1px solid #cccccc; padding: 5px; 
-                                  width: 100%; height: 100%; font-size: 14px; z-index: 20; 
-                                  border-radius: 5px; top: 0; left: 0; box-sizing: border-box;" 
-                             class="summary">
-                             Summary: {article["summary"]}
-                        </div>
-                    </div>
-                    <div style="margin-top: 8px;">
-                        <a href="{article["link"]}" style="font-size: 16px; color: {border_color}; 
-                           text-decoration: none;">Read more</a>
-                    </div>
-                </div>
-            </td>
-        </tr>'''
+    def generate_article(self, article: Dict, border_color: Optional[str] = None) -> str:
+        """Generate the HTML for a single news article.
 
-    def generate_category_section(self, category: str, articles: List[Dict]) -> str:
-        """Generate a section for a specific category with a colored header."""
+        `border_color` may be passed in when the caller has already resolved the
+        category color, saving a lookup per article. Rendered articles are
+        memoized, so an article that appears again (e.g. a repost of a
+        newsletter item) is returned without re-rendering.
+        """
+        if border_color is None:
+            border_color = self.category_color(article.get("category", "Other"))
+        return _render_article_cached(article, border_color, self.skip_images, self.pre_escaped)
 
-        header_color = self.category_colors.get(category, self.category_colors["Other"])
-        articles_html = "\n".join(self.generate_article(article) for article in articles)
-        return f'''
-        <tr>
-            <td style="background-color: {header_color}; color: #ffffff; text-align: center; padding: 10px; font-size: 18px;">
-                {category}
-            </td>
-        </tr>
-        {articles_html}'''
+    def generate_category_header(self, category: str) -> str:
+        """Generate the colored header row that opens a category section (cached per category)."""
+        header = self._section_headers.get(category)
+        if header is None:
+            header = SECTION_HEADER_TMPL.format_map({"header_color": self.category_color(category), "category": escape(category)})
+            self._section_headers[category] = header
+        return header
 
     def generate_footer(self) -> str:
         """Generate the footer of the email based on the footer_text variable."""
-        return f'''
-        <tr>
-            <td style="text-align: center; background-color: #f4f4f4; color: #777777; 
-                       padding: 12px; font-size: 12px;">
-                {self.footer_text}
-                <br><br>
-                <div style="margin-top: 8px; padding-top: 8px; border-top: 1px solid #cccccc;">
-                    <em>This email is automatically generated.</em>
-                </div>
-            </td>
-        </tr>
-        <tr>
-            <td style="text-align: center; background-color: #e8f4fd; color: #333333; 
-                       padding: 20px; border: 2px solid #0066cc; border-radius: 8px; margin: 10px;">
-                <div style="font-size: 18px; font-weight: bold; color: #0066cc; margin-bottom: 12px;">
-                    📝 Your Feedback Matters!
-                </div>
-                <div style="font-size: 16px; line-height: 1.4; margin-bottom: 15px;">
-                    Your feedback is really important to improve the project.<br>
-                    Please help us enhance your experience by sharing your thoughts!
-                </div>
-                <a href="https://forms.gle/UegbAWJ6zEcv7yKT8" 
-                   style="display: inline-block; background-color: #0066cc; color: #ffffff; 
-                          padding: 12px 24px; font-size: 16px; font-weight: bold; 
-                          text-decoration: none; border-radius: 5px; 
-                          box-shadow: 0 2px 4px rgba(0,102,204,0.3);">
-                    Complete Feedback Form
-                </a>
-            </td>
-        </tr>'''
+        return FOOTER_TMPL.format_map({"footer_text": self.footer_text})
+
+    def render(self, out: TextIO, articles: Iterable[Dict]) -> None:
+        """Write the full HTML content of the email to `out`.
+
+        Articles are grouped under colored category headers unless the generator
+        was created with `group_by_category=False`, in which case they are
+        emitted in the given order. `articles` is consumed exactly once, so a
+        generator works as well as a list.
+        """
+        out.write(self._prefix)
+        out.write(self.generate_header())
+        if self.group_by_category:
+            # Stable sort keeps the original article order within each category
+            ordered = sorted(articles, key=_category_of)
+            for category, group in groupby(ordered, key=_category_of):
+                out.write(self.generate_category_header(category))
+                border_color = self.category_color(category)
+                for article in group:
+                    out.write(self.generate_article(article, border_color))
+        else:
+            colors: Dict[str, str] = {}
+            for article in articles:
+                category = article.get("category", "Other")
+                border_color = colors.get(category)
+                if border_color is None:
+                    border_color = colors[category] = self.category_color(category)
+                out.write(self.generate_article(article, border_color))
+        out.write(self.generate_footer())
+        out.write(HEAD_SUFFIX)
+
+    def generate_email(self, articles: Iterable[Dict]) -> str:
+        """Generate the full HTML content of the email as a string."""
+        buf = io.StringIO()
+        self.render(buf, articles)
+        return buf.getvalue()
 
-    def generate_email(self, articles: List[Dict]) -> str:
-        """Generate the full HTML content of the email, grouping articles by category."""
-        articles_by_category = defaultdict(list)
-        for article in articles:
-            category = article.get("category", "Other")
-            articles_by_category[category].append(article)
-
-        sorted_categories = sorted(articles_by_category.keys())
-        sections_html = "\n".join(
-            self.generate_category_section(category, articles_by_category[category])
-            for category in sorted_categories
-        )
-
-        return f'''<!DOCTYPE html>
-<html>
-    <head>
-        <meta charset="UTF-8" />
-        <meta name="viewport" content="width=device-width, initial-scale=1.0" />
-        <title>{self.title}</title>
-        <style type="text/css">
-            .article-desc {{
-                position: relative !important;
-                display: block !important;
-            }}
-            .article-desc .summary {{
-                opacity: 0;
-                visibility: hidden;
-                transition: opacity 0.2s;
-            }}
-            .article-desc:hover .summary {{
-                display: block !important;
-                opacity: 1 !important;
-                visibility: visible !important;
-            }}
-            body {{
-                margin: 0;
-                padding: 0;
-            }}
-            table {{
-                margin: 0;
-                padding: 0;
-            }}
-        </style>
-    </head>
-    <body style="margin: 0; padding: 0; background-color: #f4f4f4; font-family: Arial, sans-serif;">
-        <table width="100%" cellpadding="0" cellspacing="0" style="background-color: #f4f4f4; margin: 0;">
-            <tr>
-                <td align="center" style="padding: 0;">
-                    <table width="600" cellpadding="0" cellspacing="0" style="background-color: #ffffff; margin: 0;">
-                        {self.generate_header()}
-                        {sections_html}
-                        {self.generate_footer()}
-                    </table>
-                </td>
-            </tr>
-        </table>
-    </body>
-</html>'''
+    def generate_email_bytes(self, articles: Iterable[Dict]) -> bytes:
+        """Generate the full HTML content of the email encoded as UTF-8, ready for a binary write."""
+        return self.generate_email(articles).encode("utf-8")
 
 if __name__ == "__main__":
     sample_news = [
@@ -194,7 +164,6 @@ if __name__ == "__main__":
     ]
 
     generator = NewsEmailGenerator()
-    email_html = generator.generate_email(sample_news)
 
-    with open("../files/output.html", "w", encoding="utf-8") as f:
-        f.write(email_html)
+    with open("../files/output.html", "wb") as f:
+        f.write(generator.generate_email_bytes(sample_news))
@@ -1,13 +1,22 @@
 import email
+import logging
 import os
 import base64
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from datetime import datetime, timedelta
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-from typing import List, Optional, Dict, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
 
-from bs4 import BeautifulSoup
+import httplib2
+import lxml.etree
+import lxml.html
 from google.auth.transport.requests import Request
+from google_auth_httplib2 import AuthorizedHttp
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
@@ -22,6 +31,55 @@ SCOPES = [
 # Define system labels consistently across all methods
 SYSTEM_LABELS = {"INBOX", "UNREAD", "STARRED", "SENT", "IMPORTANT", "TRASH", "SPAM", "DRAFT"}
 
+# Sub-requests per Gmail batch HTTP call (the API allows 100, Google recommends <= 50)
+BATCH_SIZE = 50
+# Batch HTTP calls in flight at once when fetching many messages
+MAX_PARALLEL_BATCHES = 4
+# Message ids per messages.batchModify call (API maximum)
+BATCH_MODIFY_SIZE = 1000
+# Message stubs per messages.list page (API maximum)
+LIST_PAGE_SIZE = 500
+# Headers requested when only message metadata is needed
+METADATA_HEADERS = ["From", "Subject", "Date"]
+
+# XPath selectors compiled once at import instead of on every e-mail
+_LINK_HREFS = lxml.etree.XPath("//a/@href")
+_IMAGE_SRCS = lxml.etree.XPath("//img/@src")
+# One HTML parser shared by every e-mail; lxml parsers are reusable and
+# recover from broken markup by default
+_HTML_PARSER = lxml.html.HTMLParser(encoding="utf-8")
+
+# Transient HTTP statuses (rate limit / server side) worth retrying
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRIES = 5
+MAX_RETRY_DELAY = 64
+
+# Credentials per token file, shared by every GmailHelper in the process so
+# token.json is parsed once and only refreshed when the access token expires
+_CREDS_CACHE: Dict[str, Credentials] = {}
+_CREDS_LOCK = threading.Lock()
+
+
+def _execute_with_retry(request, http=None):
+    """
+    Execute a googleapiclient request (or batch), retrying 429/5xx errors with
+    exponential back-off plus jitter. A `Retry-After` header from the server
+    takes precedence over the computed delay.
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            return request.execute(http=http)
+        except HttpError as e:
+            if e.resp.status not in RETRYABLE_STATUSES or attempt == MAX_RETRIES:
+                raise
+            retry_after = e.resp.get("retry-after")
+            if retry_after and retry_after.isdigit():
+                wait = int(retry_after)
+            else:
+                wait = min(MAX_RETRY_DELAY, 2 ** attempt + random.random())
+            logging.warning(f"Gmail API returned {e.resp.status}, retry {attempt + 1}/{MAX_RETRIES} in {wait:.1f}s")
+            time.sleep(wait)
+
 
 class GmailHelper:
     """
@@ -41,26 +99,42 @@ class GmailHelper:
         token_file: str = "credentials/token.json",
     ):
         self.creds = self._load_credentials(credentials_file, token_file)
-        self.service = build("gmail", "v1", credentials=self.creds)
+        # Use the discovery document bundled with googleapiclient rather than
+        # fetching it over the network on every construction
+        self.service = build(
+            "gmail", "v1", credentials=self.creds,
+            cache_discovery=False, static_discovery=True,
+        )
 
     @staticmethod
     def _load_credentials(credentials_file: str, token_file: str) -> Credentials:
-        creds = None
-        if os.path.exists(token_file):
-            creds = Credentials.from_authorized_user_file(token_file, SCOPES)
-
-        # refresh / run flow if necessary
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                creds.refresh(Request())
-            else:
-                flow = InstalledAppFlow.from_client_secrets_file(
-                    credentials_file, SCOPES
-                )
-                creds = flow.run_local_server(port=0, open_browser=False)
-            with open(token_file, "w") as f:
-                f.write(creds.to_json())
-        return creds
+        with _CREDS_LOCK:
+            creds = _CREDS_CACHE.get(token_file)
+            if creds is not None and creds.valid:
+                return creds
+
+            saved_token = None
+            if creds is None and os.path.exists(token_file):
+                creds = Credentials.from_authorized_user_file(token_file, SCOPES)
+                saved_token = creds.to_json()
+
+            # refresh / run flow if necessary
+            if not creds or not creds.valid:
+                if creds and creds.expired and creds.refresh_token:
+                    creds.refresh(Request())
+                else:
+                    flow = InstalledAppFlow.from_client_secrets_file(
+                        credentials_file, SCOPES
+                    )
+                    creds = flow.run_local_server(port=0, open_browser=False)
+
+            # only touch token.json when the token actually changed
+            token_json = creds.to_json()
+            if token_json != saved_token:
+                with open(token_file, "w", encoding="utf-8") as f:
+                    f.write(token_json)
+            _CREDS_CACHE[token_file] = creds
+            return creds
 
     def list_emails(
         self,
@@ -72,7 +146,7 @@ class GmailHelper:
         include_labels: Optional[List[str]] = None, # Must have ALL these labels
         exclude_labels: Optional[List[str]] = None, # Must NOT have ANY of these labels
         sender: Optional[str] = None,
-        max_results: int = 100,
+        max_results: Optional[int] = 100,
         limit_newest: Optional[int] = None,  # Limit to newest N emails (oldest eliminated)
     ) -> List[Dict]:
         """
@@ -83,6 +157,7 @@ class GmailHelper:
         for the Gmail `before:` keyword which is < exclusive).
         `archived_status`: 0 for in INBOX, 1 for not in INBOX (archived), 2 for no filter.
         `read_status`: 0 for unread, 1 for read, 2 for no filter.
+        `max_results`: Cap on returned stubs; None pages through every match.
         `limit_newest`: If provided, returns only the newest N emails (Gmail returns newest first by default).
         """
         query_parts: List[str] = []
@@ -91,7 +166,7 @@ class GmailHelper:
         # Determine the actual limit to use for the API call
         # Gmail returns emails in reverse chronological order (newest first)
         api_max_results = max_results
-        if limit_newest is not None and limit_newest < max_results and limit_newest > 0:
+        if limit_newest is not None and limit_newest > 0 and (max_results is None or limit_newest < max_results):
             api_max_results = limit_newest
 
         # --- date range -----------------------------------------------------
@@ -160,44 +235,123 @@ class GmailHelper:
         query_str = " ".join(query_parts) if query_parts else None
 
         try:
-            resp = (
-                self.service.users()
-                .messages()
-                .list(
-                    userId="me",
-                    q=query_str,
-                    labelIds=label_ids_to_include_server_side, 
-                    maxResults=api_max_results,  # Use the computed limit
-                )
-                .execute()
-            )
-            messages = resp.get("messages", [])
-            
-            # Additional client-side limiting if needed
-            # (Gmail should already return in newest-first order, but this ensures consistency)
-            if limit_newest is not None and len(messages) > limit_newest:
-                messages = messages[:limit_newest]
-                
-            return messages
+            # Gmail returns emails newest first, so taking the first N stubs
+            # across pages keeps the newest N
+            return list(islice(
+                self._iter_message_stubs(query_str, label_ids_to_include_server_side, api_max_results),
+                api_max_results,
+            ))
         except HttpError as e:
             print(f"Gmail API error while listing messages: {e}")
             return []
 
+    def _iter_message_stubs(
+        self,
+        query: Optional[str],
+        label_ids: Optional[List[str]],
+        limit: Optional[int] = None,
+    ) -> Iterator[Dict]:
+        """
+        Yield message stubs page by page via `list_next`, so results beyond a
+        single page are not silently dropped. `limit` only sizes the pages;
+        callers stop consuming once they have enough.
+        """
+        page_size = LIST_PAGE_SIZE if limit is None else min(limit, LIST_PAGE_SIZE)
+        messages_api = self.service.users().messages()
+        request = messages_api.list(
+            userId="me",
+            q=query,
+            labelIds=label_ids,
+            maxResults=page_size,
+        )
+        while request is not None:
+            resp = _execute_with_retry(request)
+            yield from resp.get("messages", [])
+            request = messages_api.list_next(request, resp)
+
     def parse_email(self, message_id: str) -> Dict:
         """
         Resolve a full Gmail message and return:
         sender, title, text_content, html_content, links, images, labels, date
         """
         msg = (
-            self.service.users().messages().get(userId="me", id=message_id, format="full").execute()
+            _execute_with_retry(self.service.users().messages().get(userId="me", id=message_id, format="full"))
         )
+        return self._parse_message(msg)
+
+    def parse_emails(self, message_ids: List[str], metadata_only: bool = False) -> List[Dict]:
+        """
+        Batched `parse_email`: fetches the messages with Gmail batch HTTP
+        requests (up to BATCH_SIZE per round trip instead of one each) and
+        returns the parsed dicts in the order of `message_ids`.
+        Messages that fail to fetch are reported and left out.
+
+        `metadata_only=True` requests `format="metadata"` with just the
+        From/Subject/Date headers: sender, title, labels and date are filled
+        in while text, html, links and images stay empty. Use it when only
+        the headers are needed, it skips downloading the MIME bodies.
+        """
+        if metadata_only:
+            get_kwargs = {"format": "metadata", "metadataHeaders": METADATA_HEADERS}
+        else:
+            get_kwargs = {"format": "full"}
+        unique_ids = list(dict.fromkeys(message_ids))
+        fetched: Dict[str, Dict] = {}
+
+        throttled: List[str] = []
+
+        def collect(request_id, response, exception):
+            if exception is not None:
+                if isinstance(exception, HttpError) and exception.resp.status in RETRYABLE_STATUSES:
+                    throttled.append(request_id)
+                else:
+                    print(f"Gmail API error while fetching message {request_id}: {exception}")
+                return
+            fetched[request_id] = response
+
+        batches = []
+        for start in range(0, len(unique_ids), BATCH_SIZE):
+            batch = self.service.new_batch_http_request(callback=collect)
+            for message_id in unique_ids[start:start + BATCH_SIZE]:
+                batch.add(
+                    self.service.users().messages().get(userId="me", id=message_id, **get_kwargs),
+                    request_id=message_id,
+                )
+            batches.append(batch)
+
+        if len(batches) == 1:
+            _execute_with_retry(batches[0])
+        elif batches:
+            # httplib2 connections are not thread-safe: each batch runs on its own authorized Http
+            with ThreadPoolExecutor(max_workers=min(MAX_PARALLEL_BATCHES, len(batches))) as pool:
+                list(pool.map(lambda batch: _execute_with_retry(batch, http=self._new_http()), batches))
+
+        # sub-requests rejected with 429/5xx inside a batch are retried one by one with back-off
+        for message_id in throttled:
+            try:
+                fetched[message_id] = _execute_with_retry(
+                    self.service.users().messages().get(userId="me", id=message_id, **get_kwargs)
+                )
+            except HttpError as e:
+                print(f"Gmail API error while fetching message {message_id}: {e}")
+
+        return [self._parse_message(fetched[message_id]) for message_id in unique_ids if message_id in fetched]
 
+    def _parse_message(self, msg: Dict) -> Dict:
+        """Turn a `full` (or `metadata`) message resource into the dict returned by `parse_email`."""
+        message_id = msg["id"]
         headers = {h["name"].lower(): h["value"] for h in msg["payload"]["headers"]}
         date_rfc2822 = headers.get("date")
         date_obj = email.utils.parsedate_to_datetime(date_rfc2822) if date_rfc2822 else None
 
         plain, html = self._extract_bodies(msg["payload"])
-        links, images = self._extract_links_and_images(html)
+        root = self._parse_html(html)
+        links, images = self._extract_links_and_images(root)
+        if not plain.strip() and root is not None:
+            # HTML-only mail (common for newsletters): take the visible text from the tree;
+            # links and images are already extracted, so the tree can be pruned in place
+            lxml.etree.strip_elements(root, "head", "script", "style", "title", with_tail=False)
+            plain = root.text_content()
 
         return {
             "id": message_id,
@@ -213,56 +367,71 @@ class GmailHelper:
 
     @staticmethod
     def _extract_bodies(payload) -> Tuple[str, str]:
-        """Recursively walk MIME parts → (plain, html)"""
-        plain, html = "", ""
-
-        def walk(part):
-            nonlocal plain, html
-            if part.get("parts"):
-                for sub in part["parts"]:
-                    walk(sub)
-            else:
-                data = part.get("body", {}).get("data")
-                if not data:
-                    return
-                decoded = base64.urlsafe_b64decode(data.encode()).decode("utf-8", "replace")
-                if part["mimeType"] == "text/plain":
-                    plain += decoded
-                elif part["mimeType"] == "text/html":
-                    html += decoded
-
-        walk(payload)
-        return plain, html
+        """Walk MIME parts depth-first with an explicit stack → (plain, html)"""
+        plain_parts: List[str] = []
+        html_parts: List[str] = []
+
+        stack = [payload]
+        while stack:
+            part = stack.pop()
+            subparts = part.get("parts")
+            if subparts:
+                # reversed so parts are still visited in document order
+                stack.extend(reversed(subparts))
+                continue
+            body = part.get("body")
+            data = body.get("data") if body else None
+            if not data:
+                continue
+            mime_type = part.get("mimeType")
+            if mime_type == "text/plain":
+                plain_parts.append(base64.urlsafe_b64decode(data).decode("utf-8", "replace"))
+            elif mime_type == "text/html":
+                html_parts.append(base64.urlsafe_b64decode(data).decode("utf-8", "replace"))
+
+        return "".join(plain_parts), "".join(html_parts)
 
     @staticmethod
-    def _extract_links_and_images(html: str) -> Tuple[List[str], List[str]]:
-        if not html:
+    def _parse_html(html: str) -> Optional[lxml.html.HtmlElement]:
+        """Parse an HTML body once for link, image and text extraction; None if there is nothing to parse."""
+        if not html or not html.strip():
+            return None
+        # lxml's C parser is far faster than BeautifulSoup for long newsletter HTML,
+        # and XPath pulls the attributes without building a soup tree. Feeding
+        # bytes with an explicit encoding also copes with XML declarations.
+        try:
+            return lxml.html.fromstring(html.encode("utf-8"), parser=_HTML_PARSER)
+        except lxml.etree.ParserError:
+            # e.g. a body made only of comments
+            return None
+
+    @staticmethod
+    def _extract_links_and_images(root: Optional[lxml.html.HtmlElement]) -> Tuple[List[str], List[str]]:
+        if root is None:
             return [], []
-        soup = BeautifulSoup(html, "html.parser")
-        
-        # Extract links but filter out problematic ones
-        raw_links = [a["href"] for a in soup.find_all("a", href=True)]
-        filtered_links = []
-        
-        for link in raw_links:
-            # Skip mailto:, tel:, sms:, and other protocol links that trigger system actions
-            if link.lower().startswith(('mailto:', 'tel:', 'sms:', 'callto:', 'skype:')):
-                continue
-            # Skip javascript: links
-            if link.lower().startswith('javascript:'):
-                continue
+
+        # Single pass over the anchors: filter and de-duplicate as we go, so a
+        # newsletter repeating the same link in header/body/footer is scraped once.
+        # dicts keep insertion order, i.e. the order links appear in the mail.
+        links: Dict[str, None] = {}
+        for href in _LINK_HREFS(root):
+            link = str(href)
+            stripped = link.strip()
             # Skip empty or anchor-only links
-            if not link.strip() or link.strip() == '#':
+            if not stripped or stripped == '#':
                 continue
-                
-            filtered_links.append(link)
-        
-        images = [img["src"] for img in soup.find_all("img", src=True)]
-        return filtered_links, images
+            # Skip mailto:, tel:, sms:, and other protocol links that trigger system actions,
+            # as well as javascript: links
+            if link.lower().startswith(('mailto:', 'tel:', 'sms:', 'callto:', 'skype:', 'javascript:')):
+                continue
+            links[link] = None
+
+        images = dict.fromkeys(str(src) for src in _IMAGE_SRCS(root))
+        return list(links), list(images)
 
     def delete_email(self, message_id: str) -> bool:
         try:
-            self.service.users().messages().delete(userId="me", id=message_id).execute()
+            _execute_with_retry(self.service.users().messages().delete(userId="me", id=message_id))
             return True
         except HttpError as e:
             print("Gmail API error while deleting:", e)
@@ -270,7 +439,7 @@ class GmailHelper:
 
     def archive_email(self, message_id: str) -> bool:
         try:
-            self.service.users().messages().modify(userId="me", id=message_id, body={"removeLabelIds": ["INBOX"]}).execute()
+            _execute_with_retry(self.service.users().messages().modify(userId="me", id=message_id, body={"removeLabelIds": ["INBOX"]}))
             return True
         except HttpError as e:
             print("Gmail API error while archiving:", e)
@@ -288,41 +457,42 @@ class GmailHelper:
         • Creates missing labels automatically.  
         • Handles the read/unread toggle via UNREAD system label.
         """
-        add_ids, remove_ids = [], []
-
-        # convert custom label names → IDs
-        for name in labels_to_add or []:
-            if name.upper() in SYSTEM_LABELS:  # Use consistent system labels set
-                add_ids.append(name.upper())
-            else:
-                add_ids.append(self._ensure_label_id(name))
-
-        for name in labels_to_remove or []:
-            if name.upper() in SYSTEM_LABELS:  # Use consistent system labels set
-                remove_ids.append(name.upper())
-            else:
-                remove_ids.append(self._ensure_label_id(name))
-
-        # read/unread flag → adjust UNREAD label
-        if read is True:
-            remove_ids.append("UNREAD")
-        elif read is False:
-            add_ids.append("UNREAD")
-
-        body: Dict[str, List[str]] = {}
-        if add_ids:
-            body["addLabelIds"] = add_ids
-        if remove_ids:
-            body["removeLabelIds"] = remove_ids
+        body = self._build_label_body(labels_to_add, labels_to_remove, read)
 
         try:
-            self.service.users().messages().modify(
+            _execute_with_retry(self.service.users().messages().modify(
                 userId="me", id=message_id, body=body
-            ).execute()
+            ))
             return True
         except HttpError as e:
             print("Gmail API error while updating labels/state:", e)
             return False
+
+    def update_emails_state(
+        self,
+        message_ids: List[str],
+        labels_to_add: Optional[List[str]] = None,
+        labels_to_remove: Optional[List[str]] = None,
+        read: Optional[bool] = None,
+    ) -> bool:
+        """
+        `update_email_state` for many messages at once: one
+        `messages.batchModify` call per BATCH_MODIFY_SIZE ids instead of one
+        `modify` call (and label lookup) per message.
+        """
+        if not message_ids:
+            return True
+        body = self._build_label_body(labels_to_add, labels_to_remove, read)
+
+        try:
+            for start in range(0, len(message_ids), BATCH_MODIFY_SIZE):
+                _execute_with_retry(self.service.users().messages().batchModify(
+                    userId="me", body={"ids": message_ids[start:start + BATCH_MODIFY_SIZE], **body}
+                ))
+            return True
+        except HttpError as e:
+            print("Gmail API error while batch-updating labels/state:", e)
+            return False
     
     def send_email_html(
         self,
@@ -340,7 +510,7 @@ class GmailHelper:
         raw = base64.urlsafe_b64encode(mime.as_bytes()).decode()
         try:
             return (
-                self.service.users().messages().send(userId="me", body={"raw": raw}).execute()
+                _execute_with_retry(self.service.users().messages().send(userId="me", body={"raw": raw}))
             )
         except HttpError as e:
             print("Gmail API error while sending:", e)
@@ -354,8 +524,9 @@ class GmailHelper:
         sender: Optional[str] = None,
     ):
         try:
-            with open(html_path, "r", encoding="utf-8") as f:
-                html = f.read()
+            # one binary read + decode; skips the text-mode newline translation layer
+            with open(html_path, "rb") as f:
+                html = f.read().decode("utf-8")
             return self.send_email_html(to, subject, html, sender)
         except FileNotFoundError:
             print(f"HTML file not found: {html_path}")
@@ -363,13 +534,52 @@ class GmailHelper:
 
     # ---------- helpers -----------------------------------------------------
     
+    def _new_http(self) -> AuthorizedHttp:
+        """A fresh authorized HTTP client, for requests issued from worker threads."""
+        return AuthorizedHttp(self.creds, http=httplib2.Http())
+
     # ---------- label helpers -----------------------------------------------------
+    def _build_label_body(
+        self,
+        labels_to_add: Optional[List[str]],
+        labels_to_remove: Optional[List[str]],
+        read: Optional[bool],
+    ) -> Dict[str, List[str]]:
+        """Translate label names + read flag into a modify/batchModify request body."""
+        add_ids, remove_ids = [], []
+
+        # convert custom label names → IDs
+        for name in labels_to_add or []:
+            if name.upper() in SYSTEM_LABELS:  # Use consistent system labels set
+                add_ids.append(name.upper())
+            else:
+                add_ids.append(self._ensure_label_id(name))
+
+        for name in labels_to_remove or []:
+            if name.upper() in SYSTEM_LABELS:  # Use consistent system labels set
+                remove_ids.append(name.upper())
+            else:
+                remove_ids.append(self._ensure_label_id(name))
+
+        # read/unread flag → adjust UNREAD label
+        if read is True:
+            remove_ids.append("UNREAD")
+        elif read is False:
+            add_ids.append("UNREAD")
+
+        body: Dict[str, List[str]] = {}
+        if add_ids:
+            body["addLabelIds"] = add_ids
+        if remove_ids:
+            body["removeLabelIds"] = remove_ids
+        return body
+
     def _get_labels_indexed_by_name(self) -> Dict[str, str]:
         """
         Returns {lower-cased label name → label ID} for **all** labels
         the user currently has.
         """
-        resp = self.service.users().labels().list(userId="me").execute()
+        resp = _execute_with_retry(self.service.users().labels().list(userId="me"))
         return {lbl["name"].lower(): lbl["id"] for lbl in resp.get("labels", [])}
 
     def _ensure_label_id(self, label_name: str) -> str:
@@ -388,7 +598,7 @@ class GmailHelper:
             "messageListVisibility": "show",
         }
         new_label = (
-            self.service.users().labels().create(userId="me", body=body).execute()
+            _execute_with_retry(self.service.users().labels().create(userId="me", body=body))
         )
         return new_label["id"]
     
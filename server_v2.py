@@ -1,9 +1,11 @@
 from datetime import datetime, timedelta
+import functools
 import json
 import os
 import threading
 import logging
 import time
+from concurrent.futures import ThreadPoolExecutor
 from logging.handlers import RotatingFileHandler
 
 from modules.AI.flows import analyze_repost, analyze_emails_newsletter
@@ -29,7 +31,7 @@ rotating_handler = RotatingFileHandler(
 rotating_handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
 
 logging.basicConfig(
-    level=logging.INFO,
+    level=os.environ.get("LOG_LEVEL", "INFO").upper(),
     format="%(asctime)s [%(levelname)s] %(message)s",
     handlers=[
         rotating_handler,
@@ -54,7 +56,7 @@ def check_directories():
 
     if not os.path.exists("configs/setup.json"):
         logging.warning("Setup file not found, creating default setup file")
-        with open("configs/setup.json", "w") as f:
+        with open("configs/setup.json", "w", encoding="utf-8") as f:
             json.dump({"active": True, "days": [], "release_time_str": "", "seconds_between_checks": 10}, f)
 
 check_directories()
@@ -72,7 +74,7 @@ limit_newest = None
 
 
 def load_setup():
-    with open("configs/setup.json", "r") as f:
+    with open("configs/setup.json", "r", encoding="utf-8") as f:
         setup = json.load(f)
 
     active = setup.get("active", True)
@@ -97,12 +99,26 @@ gemini_handler = GeminiHandler()
 logging.info("Current time: %s", datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
 
 
+# The e-mail generators only hold configuration (and caches of rendered
+# fragments), so one instance of each serves every run of the server.
+# GmailHelper stays per thread: its httplib2 connection is not thread-safe,
+# and its credentials and discovery document are already shared.
+@functools.lru_cache(maxsize=1)
+def _news_email_generator() -> NewsEmailGenerator:
+    return NewsEmailGenerator()
+
+
+@functools.lru_cache(maxsize=1)
+def _repost_email_generator() -> RepostEmailGenerator:
+    return RepostEmailGenerator()
+
+
 """REPOST"""
 def create_repost_email(parsed_mail, send_mail=True):
     try:
         # Create a separate Gmail instance for this thread to avoid thread safety issues
         thread_gh = GmailHelper()
-        repost_email_generator = RepostEmailGenerator()
+        repost_email_generator = _repost_email_generator()
 
         articles = analyze_repost(parsed_mail, intensive_mode=True, include_link_info=True, include_images=True, gemini_handler=gemini_handler)
 
@@ -147,7 +163,7 @@ def create_news_letter(send_mail=True):
     try:
         logging.info("---STARTING--- Creating newsletter")
         thread_gh = GmailHelper()
-        generator = NewsEmailGenerator()
+        generator = _news_email_generator()
         
         emails_to_analyze = [] # list of emails to analyze
 
@@ -166,34 +182,47 @@ def create_news_letter(send_mail=True):
 
         logging.debug("Found %s unprocessed mails", len(msgs))
 
-        for msg in msgs:
-            try:
-                logging.info("Found unprocessed mail candidate for newsletter: %s", msg)
-                # parse the mail
-                mail = thread_gh.parse_email(msg["id"])
-                logging.info("Parsed mail (first 5 words): %s", " ".join(mail.get("text", "").split()[:5]))
-                emails_to_analyze.append(mail)
-                
-                # add the label "ANALYZED" to the mail with retry logic
-                max_retries = 3
-                for attempt in range(max_retries):
-                    try:
-                        thread_gh.update_email_state(msg["id"], labels_to_add=["ANALYZED"])
+        # parse all candidates with batched requests instead of one round trip per mail
+        parsed_mails = thread_gh.parse_emails([msg["id"] for msg in msgs])
+
+        for mail in parsed_mails:
+            logging.info("Found unprocessed mail candidate for newsletter: %s", mail["id"])
+            logging.info("Parsed mail (first 5 words): %s", " ".join(mail.get("text", "").split()[:5]))
+            emails_to_analyze.append(mail)
+
+        if not emails_to_analyze:
+            logging.info("No new mails to analyze, skipping newsletter")
+            return
+
+        # add the label "ANALYZED" to all the mails in one batchModify call, with retry logic
+        analyzed_ids = [mail["id"] for mail in emails_to_analyze]
+
+        def label_analyzed():
+            max_retries = 3
+            for attempt in range(max_retries):
+                try:
+                    if thread_gh.update_emails_state(analyzed_ids, labels_to_add=["ANALYZED"]):
                         break
-                    except Exception as e:
-                        if attempt == max_retries - 1:
-                            logging.error(f"Failed to label email {msg['id']} after {max_retries} attempts: {e}")
-                        else:
-                            logging.warning(f"Attempt {attempt + 1} failed to label email {msg['id']}: {e}, retrying...")
-                            time.sleep(2 ** attempt)  # exponential backoff
-                            
-            except Exception as e:
-                logging.error(f"Error processing email {msg.get('id', 'unknown')}: {e}")
-                continue
-        
+                    raise RuntimeError("batchModify request failed")
+                except Exception as e:
+                    if attempt == max_retries - 1:
+                        logging.error(f"Failed to label {len(analyzed_ids)} emails after {max_retries} attempts: {e}")
+                    else:
+                        logging.warning(f"Attempt {attempt + 1} failed to label {len(analyzed_ids)} emails: {e}, retrying...")
+                        time.sleep(2 ** attempt)  # exponential backoff
+
         # TODO: remove any duplicate articles
 
-        articles = analyze_emails_newsletter(emails_to_analyze, intensive_mode=True, include_link_info=True, include_website_news=True, include_images=True, gemini_handler=gemini_handler)
+        # labeling only talks to Gmail and the analysis only to the web and Gemini,
+        # so the two overlap; the label call finishes before thread_gh is used again
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            labeling = pool.submit(label_analyzed)
+            articles = analyze_emails_newsletter(emails_to_analyze, intensive_mode=True, include_link_info=True, include_website_news=True, include_images=True, gemini_handler=gemini_handler)
+            labeling.result()
+
+        if not articles:
+            logging.info("No news to send, skipping newsletter")
+            return
 
         email_html = generator.generate_email(articles)
 
@@ -248,86 +277,89 @@ def check_mails():
         exclude_labels=["NOT_WHITELISTED", "ANALYZED"],
     )
 
-    print("FOUND MAILS: ", len(msgs))
+    logging.info("Found %s mails", len(msgs))
+
+    # headers are enough to screen senders; only whitelisted mails need their full body
+    whitelisted_ids = []
+    for mail in gh.parse_emails([msg["id"] for msg in msgs], metadata_only=True):
+        logging.info("Found unprocessed mail to consider for config or repost: %s", mail["id"])
 
-    for msg in msgs:
-        logging.info("Found unprocessed mail to consider for config or repost: %s", msg)
-        # parse the mail
-        mail = gh.parse_email(msg["id"])
-        logging.info("Parsed mail (first 5 words): %s", " ".join(mail.get("text", "").split()[:5]))
-        
         # Extract just the email address from the full sender string
         sender_email = extract_email_address(mail["sender"])
         logging.info("Extracted sender email: %s", sender_email)
-        
+
         if sender_email in whitelisted_senders:
             logging.info("Found whitelisted sender: %s", sender_email)
-            if mail["title"].lower() == "config":
-                logging.info("Found config mail, updating config")
-
-                new_modifications = json.loads(mail["text"])
-                logging.info("New modifications: %s", new_modifications)
-                logging.info("OLD config: %s", {"active": active, "days": days, "release_time_str": release_time_str, "seconds_between_checks": seconds_between_checks, "whitelisted_senders": whitelisted_senders, "newsletter_email": newsletter_email, "limit_newest": limit_newest})
-
-                should_send_now = False
-
-                # parse the json and try to find modifications
-                for key, value in new_modifications.items():
-                    if key == "active":
-                        active = value
-                    elif key == "days":
-                        days = value
-                    elif key == "release_time_str":
-                        release_time_str = value
-                    elif key == "seconds_between_checks":
-                        seconds_between_checks = value
-                    elif key == "whitelisted_senders":
-                        whitelisted_senders = value
-                    elif key == "newsletter_email":
-                        newsletter_email = value
-                    elif key == "limit_newest":
-                        limit_newest = value
-                    elif key == "send_now":
-                        should_send_now = value
-                        logging.info("Sending newsletter now")
-                
-                logging.info("NEW config: %s", {"active": active, "days": days, "release_time_str": release_time_str, "seconds_between_checks": seconds_between_checks, "whitelisted_senders": whitelisted_senders, "newsletter_email": newsletter_email, "limit_newest": limit_newest})
-
-                # update the setup file
-                with open("configs/setup.json", "w") as f:
-                    json.dump({"active": active, "days": days, "release_time_str": release_time_str, "seconds_between_checks": seconds_between_checks, "whitelisted_senders": whitelisted_senders, "newsletter_email": newsletter_email, "limit_newest": limit_newest}, f)
-                
-                # archive the mail
-                gh.update_email_state(msg["id"], labels_to_add=["ANALYZED"])
-                gh.archive_email(msg["id"])
-
-                # send the newsletter
-                if should_send_now:
-                    if newsletter_timer_thread:
-                        newsletter_timer_thread.cancel()
-                    create_news_letter_threaded(send_mail=True)
-                    # Note: find_and_start_newsletter_timer() will be called automatically after newsletter completes
-
-                # restart the newsletter thread with new config
-                elif newsletter_timer_thread:
-                    newsletter_timer_thread.cancel()
-                    find_and_start_newsletter_timer()
-            
-            else:
-                logging.info("Found non-config mail, with title: %s, checking for reposts", mail["title"])
-                # Launch create_repost_email in a new thread
-                repost_thread = threading.Thread(target=create_repost_email, args=(mail,), daemon=True)
-                repost_thread.start()
-                logging.info("Started create_repost_email in a new thread.")
-                
-                gh.archive_email(msg["id"]) # Archive immediately
-                logging.info("Archived mail")
-        
+            whitelisted_ids.append(mail["id"])
         else:
             logging.info("Found non-whitelisted mail, with sender: %s (email: %s), skipping", mail["sender"], sender_email)
             # add the label "NOT_WHITELISTED" to the mail
-            gh.update_email_state(msg["id"], labels_to_add=["NOT_WHITELISTED"])
+            gh.update_email_state(mail["id"], labels_to_add=["NOT_WHITELISTED"])
+
+    # parse the whitelisted mails in full, with batched requests
+    for mail in gh.parse_emails(whitelisted_ids):
+        logging.info("Parsed mail (first 5 words): %s", " ".join(mail.get("text", "").split()[:5]))
+
+        if mail["title"].lower() == "config":
+            logging.info("Found config mail, updating config")
+
+            new_modifications = json.loads(mail["text"])
+            logging.info("New modifications: %s", new_modifications)
+            logging.info("OLD config: %s", {"active": active, "days": days, "release_time_str": release_time_str, "seconds_between_checks": seconds_between_checks, "whitelisted_senders": whitelisted_senders, "newsletter_email": newsletter_email, "limit_newest": limit_newest})
+
+            should_send_now = False
+
+            # parse the json and try to find modifications
+            for key, value in new_modifications.items():
+                if key == "active":
+                    active = value
+                elif key == "days":
+                    days = value
+                elif key == "release_time_str":
+                    release_time_str = value
+                elif key == "seconds_between_checks":
+                    seconds_between_checks = value
+                elif key == "whitelisted_senders":
+                    whitelisted_senders = value
+                elif key == "newsletter_email":
+                    newsletter_email = value
+                elif key == "limit_newest":
+                    limit_newest = value
+                elif key == "send_now":
+                    should_send_now = value
+                    logging.info("Sending newsletter now")
+            
+            logging.info("NEW config: %s", {"active": active, "days": days, "release_time_str": release_time_str, "seconds_between_checks": seconds_between_checks, "whitelisted_senders": whitelisted_senders, "newsletter_email": newsletter_email, "limit_newest": limit_newest})
+
+            # update the setup file
+            with open("configs/setup.json", "w", encoding="utf-8") as f:
+                json.dump({"active": active, "days": days, "release_time_str": release_time_str, "seconds_between_checks": seconds_between_checks, "whitelisted_senders": whitelisted_senders, "newsletter_email": newsletter_email, "limit_newest": limit_newest}, f)
+            
+            # archive the mail
+            gh.update_email_state(mail["id"], labels_to_add=["ANALYZED"])
+            gh.archive_email(mail["id"])
+
+            # send the newsletter
+            if should_send_now:
+                if newsletter_timer_thread:
+                    newsletter_timer_thread.cancel()
+                create_news_letter_threaded(send_mail=True)
+                # Note: find_and_start_newsletter_timer() will be called automatically after newsletter completes
 
+            # restart the newsletter thread with new config
+            elif newsletter_timer_thread:
+                newsletter_timer_thread.cancel()
+                find_and_start_newsletter_timer()
+        
+        else:
+            logging.info("Found non-config mail, with title: %s, checking for reposts", mail["title"])
+            # Launch create_repost_email in a new thread
+            repost_thread = threading.Thread(target=create_repost_email, args=(mail,), daemon=True)
+            repost_thread.start()
+            logging.info("Started create_repost_email in a new thread.")
+            
+            gh.archive_email(mail["id"]) # Archive immediately
+            logging.info("Archived mail")
 
 def find_and_start_newsletter_timer():
     global newsletter_timer_thread, release_time_str, days, active
@@ -2,6 +2,11 @@ import scrapy
 import json
 import os
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 class NewsSpider(scrapy.Spider):
     name = "news_spider"
 
@@ -9,14 +14,17 @@ class NewsSpider(scrapy.Spider):
         super().__init__(*args, **kwargs)
         # Load configuration from file if it exists
         config_path = os.path.join('files', 'news_config.json')
-        if os.path.exists(config_path):
-            with open(config_path, 'r') as f:
-                config = json.load(f)
-                self.start_urls = [config.get('news_url', url)]
-                self.article_selector = config.get('article_selector', 'article')
-                self.title_selector = config.get('title_selector', 'h2')
-                self.link_selector = config.get('link_selector', 'a')
-                self.description_selector = config.get('description_selector', 'p')
+        try:
+            with open(config_path, 'rb') as f:
+                config = json.loads(f.read())
+        except FileNotFoundError:
+            config = None
+        if config is not None:
+            self.start_urls = [config.get('news_url', url)]
+            self.article_selector = config.get('article_selector', 'article')
+            self.title_selector = config.get('title_selector', 'h2')
+            self.link_selector = config.get('link_selector', 'a')
+            self.description_selector = config.get('description_selector', 'p')
         else:
             # Default configuration
             if not url:
@@ -131,7 +139,11 @@ class NewsSpider(scrapy.Spider):
                     news_items.append(news_item)
 
         # Save news items to file
-        with open('files/latest_news.json', 'w') as f:
-            json.dump(news_items, f, indent=2)
+        if orjson is not None:
+            with open('files/latest_news.json', 'wb') as f:
+                f.write(orjson.dumps(news_items, option=orjson.OPT_INDENT_2))
+        else:
+            with open('files/latest_news.json', 'w', encoding='utf-8') as f:
+                json.dump(news_items, f, indent=2)
 
         return news_items
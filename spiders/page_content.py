@@ -25,10 +25,6 @@ class PageContentSpider(scrapy.Spider):
         # convert relative URLs to absolute URLs.
         links = [response.urljoin(link) for link in links]
 
-        # save for debugging purposes
-        with open("files/page.txt", "w", encoding="utf-8") as f:
-            f.write(cleaned_text)
-
         yield {
             'url': response.url,
             'content': cleaned_text,